@@ -1,9 +1,23 @@
-import threading
-import time
+import collections
+import re
+import traceback
 from typing import List, Callable, Optional
 
+from endstone import Logger
+
+# 预编译的方块状态清理正则
+# 通用的 [xxx] 模式已经覆盖 [facing=...]、[type=...]、[waterlogged=...] 等写法
+_BRACKET_RE = re.compile(r'\[[^\]]*\]')
+# 各命令的坐标参数个数：fill <x1 y1 z1> <x2 y2 z2> <block>，setblock <x y z> <block>
+_COORD_SLOTS = {'fill': 6, 'setblock': 3}
+
+
 class CommandExecutor:
-    def __init__(self, server, on_progress: Optional[Callable] = None, on_complete: Optional[Callable] = None, setting_manager=None, plugin_self=None):
+    __slots__ = ('server', 'on_progress', 'on_complete', 'on_cancel', 'setting_manager', 'plugin_self', 'logger',
+                 'is_running', 'current_progress', 'total_commands',
+                 '_task', '_player_name', '_batch_size', '_pending_commands')
+
+    def __init__(self, server, on_progress: Optional[Callable] = None, on_complete: Optional[Callable] = None, setting_manager=None, plugin_self=None, logger=None, on_cancel: Optional[Callable] = None):
         """
         初始化命令执行器
         :param server: 服务器实例
@@ -11,112 +25,163 @@ class CommandExecutor:
         :param on_complete: 完成回调函数
         :param setting_manager: 设置管理器实例
         :param plugin_self: 插件实例
+        :param logger: 插件日志器，调试日志是否输出由其日志级别决定
+        :param on_cancel: 取消回调函数，执行中的任务被停止时调用
         """
         self.server = server
         self.on_progress = on_progress
         self.on_complete = on_complete
+        self.on_cancel = on_cancel
         self.setting_manager = setting_manager
         self.plugin_self = plugin_self
+        self.logger = logger
+        # 执行状态与进度只在服务器主线程中读写
         self.is_running = False
         self.current_progress = 0
         self.total_commands = 0
+        self._task = None
+        self._player_name = None
+        self._batch_size = 1
+        self._pending_commands = collections.deque()
+
+    def _debug_enabled(self) -> bool:
+        """
+        检查插件日志器当前是否输出调试日志
+        """
+        return self.logger is not None and self.logger.is_enabled_for(Logger.Level.DEBUG)
 
-    def execute_commands_async(self, commands: List[str], player_name: str, center_pos: tuple = None) -> None:
+    def execute_commands_async(self, commands: List[str], player_name: str, center_pos: tuple = None) -> bool:
         """
-        异步执行命令列表
+        异步执行命令列表，由服务器调度器按设定的间隔逐条执行
         :param commands: 命令列表
         :param player_name: 玩家名称
-        :param center_pos: 建筑中心位置 (x, y, z)，如果为None则使用玩家当前位置
+        :param center_pos: 建筑中心位置 (x, y, z)
+        :return: 是否已开始执行
         """
         if self.is_running:
-            return
+            print(f"[ARC AI Builder] 已有建筑指令正在执行，无法为玩家 {player_name} 开始新的建造")
+            return False
+        
+        # 必须提供建筑中心位置，不允许使用玩家当前位置
+        if center_pos is None:
+            print(f"[ARC AI Builder] 错误：没有提供建筑位置，无法执行建筑指令")
+            return False
         
-        # 启动新线程执行命令
-        thread = threading.Thread(
-            target=self._execute_commands_thread,
-            args=(commands, player_name, center_pos),
-            daemon=True
-        )
-        thread.start()
-
-    def _execute_commands_thread(self, commands: List[str], player_name: str, center_pos: tuple = None) -> None:
-        """
-        在子线程中执行命令
-        """
         try:
             self.is_running = True
-            self.total_commands = len(commands)
             self.current_progress = 0
+            self.total_commands = len(commands)
+            self._player_name = player_name
             
-            print(f"[ARC AI Builder] 开始为玩家 {player_name} 执行 {len(commands)} 条建筑指令")
-            
-            # 必须提供建筑中心位置，不允许使用玩家当前位置
-            if center_pos is None:
-                print(f"[ARC AI Builder] 错误：没有提供建筑位置，无法执行建筑指令")
-                return
+            # 在开始执行前一次性完成预处理
+            self._pending_commands = collections.deque(self._prepare_commands(commands, center_pos))
             
-            print(f"[ARC AI Builder] 使用指定的建筑位置: {center_pos}")
+            if self._debug_enabled():
+                self.logger.debug(f"[ARC AI Builder] 开始为玩家 {player_name} 执行 {len(commands)} 条建筑指令")
+                self.logger.debug(f"[ARC AI Builder] 使用指定的建筑位置: {center_pos}")
             
-            for i, command in enumerate(commands):
-                if not self.is_running:  # 检查是否被停止
-                    break
+            # 节奏参数只在开始前读取一次：命令间隔换算为服务器tick（1秒=20tick），
+            # 每次调度执行 build_batch_size 条命令，由调度器控制节奏，避免服务器卡顿
+            delay = 0.1
+            batch_size = 1
+            if self.setting_manager:
+                try:
+                    delay = float(self.setting_manager.GetSetting("build_delay") or "0.1")
+                except ValueError:
+                    delay = 0.1
                 
                 try:
-                    # 先清理不支持的方块状态
-                    cleaned_command = self._clean_block_states(command)
-                    print(f"[ARC AI Builder] 清理后命令: {cleaned_command}")
-                    
-                    # 再转换相对坐标为绝对坐标
-                    absolute_command = self._convert_relative_coords(cleaned_command, center_pos)
-                    print(f"[ARC AI Builder] 执行命令: {absolute_command}")
-                    
-                    # 执行命令
-                    self.server.dispatch_command(self.server.command_sender, absolute_command)
-                    self.current_progress = i + 1
-                    
-                    # 调用进度回调（在主线程中执行）
-                    if self.on_progress and self.plugin_self:
-                        def progress_callback():
-                            try:
-                                self.on_progress(player_name, self.current_progress, self.total_commands)
-                            except Exception as e:
-                                print(f"[ARC AI Builder] 进度回调错误: {str(e)}")
-                        
-                        # 使用scheduler在主线程中执行回调
-                        self.server.scheduler.run_task(self.plugin_self, progress_callback, delay=0)
-                    
-                    # 添加小延迟避免服务器卡顿
-                    delay = float(self.setting_manager.GetSetting("build_delay") or "0.1") if self.setting_manager else 0.1
-                    time.sleep(delay)
-                    
+                    batch_size = int(self.setting_manager.GetSetting("build_batch_size") or "1")
+                except ValueError:
+                    batch_size = 1
+            period = max(1, int(round(delay * 20)))
+            self._batch_size = max(1, batch_size)
+            
+            self._task = self.server.scheduler.run_task(self.plugin_self, self._dispatch_next, delay=0, period=period)
+            return True
+            
+        except Exception as e:
+            print(f"[ARC AI Builder] 执行建筑指令时出错: {str(e)}")
+            self._finish_execution(notify=False)
+            return False
+
+    def _dispatch_next(self) -> None:
+        """
+        调度器回调（主线程）：执行下一批待执行的命令
+        """
+        try:
+            if not self.is_running or not self._pending_commands:
+                self._finish_execution()
+                return
+            
+            # 每次调度执行 batch_size 条命令
+            pending = self._pending_commands
+            total = self.total_commands
+            dispatch_command = self.server.dispatch_command
+            command_sender = self.server.command_sender
+            debug = self._debug_enabled()
+            for _ in range(min(self._batch_size, len(pending))):
+                command = pending.popleft()
+                try:
+                    # 执行已预处理的命令
+                    if debug:
+                        self.logger.debug(f"[ARC AI Builder] 执行命令: {command}")
+                    dispatch_command(command_sender, command)
+                    self.current_progress = total - len(pending)
                 except Exception as e:
                     print(f"[ARC AI Builder] 执行命令失败: {command}, 错误: {str(e)}")
-                    continue
             
-            # 调用完成回调（在主线程中执行）
-            if self.on_complete and self.plugin_self:
-                def complete_callback():
-                    try:
-                        self.on_complete(player_name, self.current_progress, self.total_commands)
-                    except Exception as e:
-                        print(f"[ARC AI Builder] 完成回调错误: {str(e)}")
-                
-                # 使用scheduler在主线程中执行回调
-                self.server.scheduler.run_task(self.plugin_self, complete_callback, delay=0)
-            
-            print(f"[ARC AI Builder] 玩家 {player_name} 的建筑指令执行完成")
+            # 调用进度回调（已在主线程中）
+            if self.on_progress:
+                try:
+                    self.on_progress(self._player_name, self.current_progress, total)
+                except Exception as e:
+                    print(f"[ARC AI Builder] 进度回调错误: {str(e)}")
             
+            if not self._pending_commands:
+                self._finish_execution()
+                
         except Exception as e:
             print(f"[ARC AI Builder] 执行建筑指令时出错: {str(e)}")
-        finally:
-            self.is_running = False
+            self._finish_execution()
 
-    def stop_execution(self) -> None:
+    def _finish_execution(self, notify: bool = True) -> None:
         """
-        停止命令执行
+        结束当前的执行任务
+        :param notify: 是否调用完成回调
         """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._pending_commands.clear()
+        
+        if notify and self.is_running:
+            # 调用完成回调（已在主线程中）
+            if self.on_complete:
+                try:
+                    self.on_complete(self._player_name, self.current_progress, self.total_commands)
+                except Exception as e:
+                    print(f"[ARC AI Builder] 完成回调错误: {str(e)}")
+            
+            if self._debug_enabled():
+                self.logger.debug(f"[ARC AI Builder] 玩家 {self._player_name} 的建筑指令执行完成")
+        
         self.is_running = False
 
+    def stop_execution(self) -> None:
+        """
+        停止命令执行，执行中的任务通过取消回调通知
+        """
+        was_executing = self.is_executing()
+        self._finish_execution(notify=False)
+        
+        if was_executing and self.on_cancel:
+            current, total = self.get_progress()
+            try:
+                self.on_cancel(self._player_name, current, total)
+            except Exception as e:
+                print(f"[ARC AI Builder] 取消回调错误: {str(e)}")
+
     def get_progress(self) -> tuple:
         """
         获取当前进度
@@ -130,6 +195,18 @@ class CommandExecutor:
         """
         return self.is_running
     
+    def _prepare_commands(self, commands: List[str], center_pos: tuple) -> List[str]:
+        """
+        预处理命令列表：先清理不支持的方块状态，再转换相对坐标为绝对坐标
+        :param commands: 原始命令列表
+        :param center_pos: 中心位置 (x, y, z)
+        :return: 可直接执行的命令列表
+        """
+        # 日志级别在一次预处理中不会改变，只检查一次
+        debug = self._debug_enabled()
+        return [self._convert_relative_coords(self._clean_block_states(command), center_pos, debug)
+                for command in commands]
+
     def _clean_block_states(self, command: str) -> str:
         """
         清理不支持的方块状态语法
@@ -137,94 +214,54 @@ class CommandExecutor:
         :return: 清理后的命令
         """
         try:
-            # 移除不支持的方块状态，如 [facing=east], [type=top] 等
-            # Bedrock Edition 不支持这些语法
-            import re
-            
-            # 匹配 [facing=xxx] 格式
-            command = re.sub(r'\[facing=[^\]]+\]', '', command)
-            # 匹配 [type=xxx] 格式  
-            command = re.sub(r'\[type=[^\]]+\]', '', command)
-            # 匹配 [waterlogged=true/false] 格式
-            command = re.sub(r'\[waterlogged=[^\]]+\]', '', command)
-            # 匹配其他可能的方块状态
-            command = re.sub(r'\[[^\]]*\]', '', command)
-            
-            # 移除数据值（如 carpet 0, oak_fence 0, oak_door 0 等）
-            # 匹配空格后跟数字的模式
-            command = re.sub(r'\s+\d+$', '', command)  # 移除末尾的数字
-            command = re.sub(r'\s+\d+\s+', ' ', command)  # 移除中间的数字
-            
-            # 清理多余的空格
-            command = re.sub(r'\s+', ' ', command).strip()
-            
-            return command
+            # 移除不支持的方块状态（Bedrock Edition 不支持这些语法），
+            # 不含方括号的命令无需扫描
+            if '[' in command:
+                command = _BRACKET_RE.sub('', command)
+            # 再移除数据值（如 carpet 0、oak_fence 0），拆分时同时清理多余的空格；
+            # 数据值只会出现在坐标参数和方块名之后，绝对坐标保持不变
+            parts = command.split()
+            if not parts:
+                return ''
+            slots = _COORD_SLOTS.get(parts[0].lower())
+            keep = slots + 2 if slots is not None else 1
+            return ' '.join(parts[:keep] + [part for part in parts[keep:] if not part.isdigit()])
             
         except Exception as e:
             print(f"[ARC AI Builder] 方块状态清理失败: {command}, 错误: {str(e)}")
             return command
     
-    def _convert_relative_coords(self, command: str, center_pos: tuple) -> str:
+    def _convert_relative_coords(self, command: str, center_pos: tuple, debug: bool = False) -> str:
         """
         将相对坐标转换为绝对坐标
         :param command: 包含相对坐标的命令
         :param center_pos: 中心位置 (x, y, z)
+        :param debug: 是否输出调试日志，由调用方统一判断
         :return: 转换后的命令
         """
         try:
-            import re
             x, y, z = center_pos
+            base = (x, y, z)
             
-            print(f"[ARC AI Builder] 原始命令: {command}")
-            print(f"[ARC AI Builder] 中心位置: x={x}, y={y}, z={z}")
-            
-            # 按空格分割命令
-            parts = command.split()
-            coord_count = 0
+            if debug:
+                self.logger.debug(f"[ARC AI Builder] 原始命令: {command}")
+                self.logger.debug(f"[ARC AI Builder] 中心位置: x={x}, y={y}, z={z}")
             
-            for i, part in enumerate(parts):
-                if part.startswith("~"):
-                    # 处理相对坐标
-                    if part == "~":
-                        # 简单的 ~ 坐标
-                        if coord_count % 3 == 0:
-                            parts[i] = str(x)
-                        elif coord_count % 3 == 1:
-                            parts[i] = str(y)
-                        elif coord_count % 3 == 2:
-                            parts[i] = str(z)
-                        coord_count += 1
-                    else:
-                        # 带偏移的 ~-4 或 ~+4 格式
-                        offset_str = part[1:]
-                        if not offset_str:
-                            offset = 0
-                        else:
-                            # 处理 ~+A 和 ~-A 格式
-                            if offset_str.startswith('+'):
-                                offset = int(offset_str[1:])
-                            else:
-                                offset = int(offset_str)
-                        
-                        if coord_count % 3 == 0:
-                            parts[i] = str(x + offset)
-                        elif coord_count % 3 == 1:
-                            parts[i] = str(y + offset)
-                        elif coord_count % 3 == 2:
-                            parts[i] = str(z + offset)
-                        coord_count += 1
-                        
-                        print(f"[ARC AI Builder] 坐标 {coord_count}: {part} -> {parts[i]}")
-                elif part.isdigit() or (part.startswith('-') and part[1:].isdigit()):
-                    # 处理绝对坐标，也要计数
-                    coord_count += 1
+            # 只转换命令固定位置上的坐标参数，方块名等其余参数保持不变
+            parts = command.split(' ')
+            for index in range(1, min(_COORD_SLOTS.get(parts[0].lower(), 0) + 1, len(parts))):
+                token = parts[index]
+                if token[:1] == '~':
+                    # 处理 ~、~+A 和 ~-A 格式，绝对坐标保持不变
+                    axis_value = base[(index - 1) % 3]
+                    parts[index] = str(axis_value + int(token[1:])) if len(token) > 1 else str(axis_value)
             
-            result = " ".join(parts)
-            print(f"[ARC AI Builder] 转换后命令: {result}")
+            result = ' '.join(parts)
+            if debug:
+                self.logger.debug(f"[ARC AI Builder] 转换后命令: {result}")
             return result
             
         except Exception as e:
             print(f"[ARC AI Builder] 坐标转换失败: {command}, 错误: {str(e)}")
-            import traceback
             print(f"[ARC AI Builder] 坐标转换错误详情: {traceback.format_exc()}")
             return command
@@ -1,38 +1,149 @@
+import asyncio
+import concurrent.futures
 import json
-import requests
+import httpx
+import re
 import threading
+import traceback
 from typing import Dict, List, Optional, Tuple
-import time
+
+from endstone import Logger
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    _loads = json.loads
+
+_JSON_DECODER = json.JSONDecoder()
+# 只允许 fill 和 setblock 命令（不区分大小写）
+_VALID_CMD_RE = re.compile(r'^\s*(?:fill|setblock)\s', re.IGNORECASE)
+
+# 需要重试的服务端临时错误状态码
+_RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# 提示词模板：模块加载时只构建一次，每次请求只填充可变字段
+_PROMPT_TEMPLATE = """你是一个专业的Minecraft建筑师AI。请根据以下要求生成建筑指令：
+
+建筑位置：中心点({x}, {y}, {z})，范围{size}x{size}格
+玩家需求：{requirements}
+
+经济系统价格参考：
+- 地价：每格{land_per_block}元
+- 钻石：每颗{diamond_price}元  
+- 原木：每块{log_price}元
+- 石头：每块{stone_price}元
+- 土豆：每颗{potato_price}元
+
+请生成以下内容：
+1. 建筑指令序列（使用fill或setblock命令）
+2. 预估总成本（包括材料成本和地价）
+
+要求：
+- 指令必须使用相对坐标，以中心点({x}, {y}, {z})为基准
+- 坐标范围：X轴从~-{half}到~+{half}，Z轴从~-{half}到~+{half}，Y轴根据需要调整
+- 相对坐标格式：负数偏移用~-A，正数偏移用~+A，中心点用~
+- 优先使用fill命令提高效率
+- 建筑要符合玩家需求
+- 合理使用材料，控制成本
+- 确保建筑结构稳定美观
+- 使用Minecraft Bedrock Edition命令格式
+- 不要使用方块状态语法如[facing=east]、[type=top]等
+- 不要使用数据值如carpet 0、oak_fence 0、oak_door 0等
+- 只使用基本的方块名称，如oak_log、spruce_planks、glass_pane等
+
+**重要：必须包含完整的内饰！**
+- 添加家具：床、桌子、椅子、书架、箱子、工作台、熔炉等
+- 添加装饰：花盆、画、地毯、楼梯、栅栏等
+- 添加照明：蜡烛、火把、灯笼等按照预算灵活调整
+- 添加功能区域（面积足够的话）：厨房、卧室、工作区、储物区等
+- 使用合适的方块：橡木、云杉木、石头、玻璃等
+- 多层建筑要有楼梯或者梯子
+
+请以JSON格式返回：
+{{
+    "commands": ["fill ~-5 ~ ~-5 ~+5 ~+10 ~+5 stone", "setblock ~ ~+11 ~ diamond_block"],
+    "estimated_cost": 125000,
+    "description": "建筑描述"
+}}
+
+注意：
+- 坐标使用相对坐标(~x ~y ~z)，fill命令格式为：fill <from> <to> <block>
+- setblock命令格式为：setblock <pos> <block>
+- 对于{size}x{size}范围，X和Z坐标应该从~-{half}到~+{half}
+- 例如：10x10范围使用~-5到~+5，8x8范围使用~-4到~+4
+- 正数偏移使用~+A格式，负数偏移使用~-A格式，中心点使用~
+- 方块参考：https://minecraft.wiki/w/Block
+"""
 
 class OpenAIManager:
-    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", setting_manager=None):
+    __slots__ = ('api_key', 'base_url', 'setting_manager', 'logger', 'session', 'async_session',
+                 '_loop', '_loop_thread', '_request_limit', '_inflight', '_submitted', 'economy_prices', '_prices')
+
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", setting_manager=None, logger=None):
         """
         初始化OpenAI管理器
         :param api_key: OpenAI API密钥
         :param base_url: API基础URL
         :param setting_manager: 设置管理器实例
+        :param logger: 插件日志器，调试日志是否输出由其日志级别决定
         """
         self.api_key = api_key
         self.base_url = base_url
         self.setting_manager = setting_manager
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.logger = logger
+        headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
-        })
+        }
+        # 使用 HTTP/2 长连接，多次请求复用同一条连接；连接失败时由传输层自动重试
+        self.session = httpx.Client(
+            headers=headers,
+            transport=httpx.HTTPTransport(http2=True, retries=3)
+        )
+        self.async_session = httpx.AsyncClient(
+            headers=headers,
+            transport=httpx.AsyncHTTPTransport(http2=True, retries=3)
+        )
         
-        # 设置连接池参数，增加重试机制
-        self.session.mount('https://', requests.adapters.HTTPAdapter(
-            max_retries=requests.adapters.Retry(
-                total=3,
-                backoff_factor=1,
-                status_forcelist=[500, 502, 503, 504]
-            )
-        ))
+        # 所有玩家的生成请求共用一个后台事件循环，等待API响应时不占用线程
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._run_loop, name="ARCAIBuilderOpenAI", daemon=True)
+        self._loop_thread.start()
+        
+        # 限制同时进行的API请求数量，玩家集中提交时多余的请求在事件循环中排队，不会超出API速率限制
+        max_concurrency = 4
+        if setting_manager:
+            try:
+                max_concurrency = max(1, int(setting_manager.GetSetting("api_max_concurrency") or "4"))
+            except ValueError:
+                max_concurrency = 4
+        self._request_limit = asyncio.Semaphore(max_concurrency)
+        # 进行中的API请求 {提示词: Task}，仅在事件循环线程中访问
+        self._inflight = {}
+        # 已提交但尚未完成的生成请求，关闭时统一取消
+        self._submitted = set()
         
         # 从设置管理器加载经济系统价格配置
         self.economy_prices = self._load_economy_prices()
+        # 提示词使用的价格预先转为整数元组：(地价, 钻石, 原木, 石头, 土豆)
+        prices = self.economy_prices
+        self._prices = (int(prices["land_per_block"]), int(prices["diamond"]), int(prices["log"]),
+                        int(prices["stone"]), int(prices["potato"]))
     
+    def _debug_enabled(self) -> bool:
+        """
+        检查插件日志器当前是否输出调试日志
+        """
+        return self.logger is not None and self.logger.is_enabled_for(Logger.Level.DEBUG)
+
     def _load_economy_prices(self) -> Dict[str, int]:
         """从设置管理器加载经济系统价格配置"""
         if not self.setting_manager:
@@ -54,7 +165,22 @@ class OpenAIManager:
             "potato": int(self.setting_manager.GetSetting("economy_potato") or "30")
         }
 
-    def generate_building_commands(self, center_pos: Tuple[int, int, int], 
+    def submit_building_commands(self, center_pos: Tuple[int, int, int], 
+                                 size: int, requirements: str, 
+                                 player_name: str) -> concurrent.futures.Future:
+        """
+        在后台事件循环中生成建筑指令，可在任意线程调用
+        :return: Future，结果同 generate_building_commands
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.generate_building_commands(center_pos, size, requirements, player_name),
+            self._loop
+        )
+        self._submitted.add(future)
+        future.add_done_callback(self._submitted.discard)
+        return future
+
+    async def generate_building_commands(self, center_pos: Tuple[int, int, int], 
                                  size: int, requirements: str, 
                                  player_name: str) -> Tuple[bool, str, List[str], int]:
         """
@@ -69,8 +195,13 @@ class OpenAIManager:
             # 构建提示词
             prompt = self._build_prompt(center_pos, size, requirements)
             
-            # 调用OpenAI API
-            response = self._call_openai_api(prompt)
+            # 相同的提示词（如重复提交）合并为同一次API请求，共享返回结果
+            task = self._inflight.get(prompt)
+            if task is None:
+                task = self._loop.create_task(self._request_completion(prompt))
+                self._inflight[prompt] = task
+                task.add_done_callback(lambda _, key=prompt: self._inflight.pop(key, None))
+            response = await asyncio.shield(task)
             
             if not response:
                 return False, "OpenAI API调用失败", [], 0
@@ -83,75 +214,30 @@ class OpenAIManager:
         except Exception as e:
             return False, f"生成建筑指令时出错: {str(e)}", [], 0
 
+    async def _request_completion(self, prompt: str) -> Optional[str]:
+        """
+        在并发上限内调用OpenAI API，超出上限的请求在此排队等待
+        :param prompt: 提示词
+        :return: AI回复的文本内容，失败时返回None
+        """
+        async with self._request_limit:
+            return await self._call_openai_api(prompt)
+
     def _build_prompt(self, center_pos: Tuple[int, int, int], 
                      size: int, requirements: str) -> str:
         """
         构建发送给AI的提示词
         """
         x, y, z = center_pos
-        # 从配置加载经济价格（带默认值兜底）
-        prices = self.economy_prices if hasattr(self, 'economy_prices') and self.economy_prices else {}
-        land_per_block = int(prices.get("land_per_block", 5000))
-        diamond_price = int(prices.get("diamond", 15000))
-        log_price = int(prices.get("log", 20))
-        stone_price = int(prices.get("stone", 10))
-        potato_price = int(prices.get("potato", 30))
+        land_per_block, diamond_price, log_price, stone_price, potato_price = self._prices
         
-        prompt = f"""你是一个专业的Minecraft建筑师AI。请根据以下要求生成建筑指令：
-
-建筑位置：中心点({x}, {y}, {z})，范围{size}x{size}格
-玩家需求：{requirements}
-
-经济系统价格参考：
-- 地价：每格{land_per_block}元
-- 钻石：每颗{diamond_price}元  
-- 原木：每块{log_price}元
-- 石头：每块{stone_price}元
-- 土豆：每颗{potato_price}元
-
-请生成以下内容：
-1. 建筑指令序列（使用fill或setblock命令）
-2. 预估总成本（包括材料成本和地价）
+        return _PROMPT_TEMPLATE.format(
+            x=x, y=y, z=z, size=size, half=size // 2, requirements=requirements,
+            land_per_block=land_per_block, diamond_price=diamond_price,
+            log_price=log_price, stone_price=stone_price, potato_price=potato_price
+        )
 
-要求：
-- 指令必须使用相对坐标，以中心点({x}, {y}, {z})为基准
-- 坐标范围：X轴从~-{size//2}到~+{size//2}，Z轴从~-{size//2}到~+{size//2}，Y轴根据需要调整
-- 相对坐标格式：负数偏移用~-A，正数偏移用~+A，中心点用~
-- 优先使用fill命令提高效率
-- 建筑要符合玩家需求
-- 合理使用材料，控制成本
-- 确保建筑结构稳定美观
-- 使用Minecraft Bedrock Edition命令格式
-- 不要使用方块状态语法如[facing=east]、[type=top]等
-- 不要使用数据值如carpet 0、oak_fence 0、oak_door 0等
-- 只使用基本的方块名称，如oak_log、spruce_planks、glass_pane等
-
-**重要：必须包含完整的内饰！**
-- 添加家具：床、桌子、椅子、书架、箱子、工作台、熔炉等
-- 添加装饰：花盆、画、地毯、楼梯、栅栏等
-- 添加照明：蜡烛、火把、灯笼等按照预算灵活调整
-- 添加功能区域（面积足够的话）：厨房、卧室、工作区、储物区等
-- 使用合适的方块：橡木、云杉木、石头、玻璃等
-- 多层建筑要有楼梯或者梯子
-
-请以JSON格式返回：
-{{
-    "commands": ["fill ~-5 ~ ~-5 ~+5 ~+10 ~+5 stone", "setblock ~ ~+11 ~ diamond_block"],
-    "estimated_cost": 125000,
-    "description": "建筑描述"
-}}
-
-注意：
-- 坐标使用相对坐标(~x ~y ~z)，fill命令格式为：fill <from> <to> <block>
-- setblock命令格式为：setblock <pos> <block>
-- 对于{size}x{size}范围，X和Z坐标应该从~-{size//2}到~+{size//2}
-- 例如：10x10范围使用~-5到~+5，8x8范围使用~-4到~+4
-- 正数偏移使用~+A格式，负数偏移使用~-A格式，中心点使用~
-- 方块参考：https://minecraft.wiki/w/Block
-"""
-        return prompt
-
-    def _call_openai_api(self, prompt: str) -> Optional[str]:
+    async def _call_openai_api(self, prompt: str) -> Optional[str]:
         """
         调用OpenAI API
         """
@@ -180,10 +266,13 @@ class OpenAIManager:
                         "content": prompt
                     }
                 ],
-                "stream": False
+                # 流式返回：边下载边解码每个数据块，长回复不会因整体耗时触发读取超时
+                "stream": True
             }
             
-            print(f"[ARC AI Builder] Request data: {json.dumps(data, ensure_ascii=False, indent=2)}")
+            if self._debug_enabled():
+                self.logger.debug(f"[ARC AI Builder] Request data: {json.dumps(data, ensure_ascii=False, indent=2)}")
+            payload = _dumps(data)
             
             # 从配置中获取超时设置
             timeout = 60
@@ -206,79 +295,113 @@ class OpenAIManager:
             for attempt in range(max_retries):
                 try:
                     print(f"[ARC AI Builder] API请求尝试 {attempt + 1}/{max_retries}")
-                    response = self.session.post(url, json=data, timeout=timeout)
-                    break
-                except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
+                    async with self.async_session.stream("POST", url, content=payload, timeout=timeout) as response:
+                        # 服务端临时错误同样重试
+                        if response.status_code not in _RETRY_STATUS_CODES or attempt == max_retries - 1:
+                            return await self._read_response(response)
+                        print(f"[ARC AI Builder] API服务端错误 {response.status_code} (尝试 {attempt + 1}/{max_retries})")
+                except httpx.TransportError as e:
                     print(f"[ARC AI Builder] API请求超时 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
                     if attempt == max_retries - 1:
                         print(f"[ARC AI Builder] API请求失败，已达到最大重试次数")
                         return None
-                    else:
-                        wait_time = (attempt + 1) * 5  # 递增等待时间：5秒、10秒、15秒
-                        print(f"[ARC AI Builder] 等待 {wait_time} 秒后重试...")
-                        time.sleep(wait_time)
-            print(f"[ARC AI Builder] Response status: {response.status_code}")
-            print(f"[ARC AI Builder] Response headers: {dict(response.headers)}")
+                wait_time = (attempt + 1) * 5  # 递增等待时间：5秒、10秒、15秒
+                print(f"[ARC AI Builder] 等待 {wait_time} 秒后重试...")
+                await asyncio.sleep(wait_time)
+            return None
             
-            if response.status_code != 200:
-                print(f"[ARC AI Builder] API Error Response: {response.text}")
-                
-                # 解析错误信息
-                try:
-                    error_data = response.json()
-                    if "error" in error_data:
-                        error_msg = error_data["error"].get("message", "Unknown error")
-                        if "Insufficient Balance" in error_msg:
-                            print(f"[ARC AI Builder] API余额不足，请充值后重试")
-                        elif "Invalid max_tokens" in error_msg:
-                            print(f"[ARC AI Builder] max_tokens参数无效: {error_msg}")
-                        else:
-                            print(f"[ARC AI Builder] API错误: {error_msg}")
-                except:
-                    print(f"[ARC AI Builder] 无法解析API错误响应")
-                
-                return None
+        except Exception as e:
+            print(f"[ARC AI Builder] OpenAI API调用失败: {str(e)}")
+            print(f"[ARC AI Builder] Traceback: {traceback.format_exc()}")
+            return None
+
+    async def _read_response(self, response: httpx.Response) -> Optional[str]:
+        """
+        读取API响应内容，支持流式（SSE）和普通JSON两种返回方式
+        :param response: 以流模式打开的响应
+        :return: AI回复的文本内容，失败时返回None
+        """
+        print(f"[ARC AI Builder] Response status: {response.status_code}")
+        if self._debug_enabled():
+            self.logger.debug(f"[ARC AI Builder] Response headers: {dict(response.headers)}")
+        
+        if response.status_code != 200:
+            await response.aread()
+            print(f"[ARC AI Builder] API Error Response: {response.text}")
             
-            result = response.json()
-            print(f"[ARC AI Builder] API Response: {json.dumps(result, ensure_ascii=False, indent=2)}")
+            # 解析错误信息
+            try:
+                error_data = _loads(response.content)
+                if "error" in error_data:
+                    error_msg = error_data["error"].get("message", "Unknown error")
+                    if "Insufficient Balance" in error_msg:
+                        print(f"[ARC AI Builder] API余额不足，请充值后重试")
+                    elif "Invalid max_tokens" in error_msg:
+                        print(f"[ARC AI Builder] max_tokens参数无效: {error_msg}")
+                    else:
+                        print(f"[ARC AI Builder] API错误: {error_msg}")
+            except:
+                print(f"[ARC AI Builder] 无法解析API错误响应")
+            
+            return None
+        
+        # 不支持流式返回的服务会直接返回完整的JSON
+        if not response.headers.get("content-type", "").startswith("text/event-stream"):
+            result = _loads(await response.aread())
+            if self._debug_enabled():
+                self.logger.debug(f"[ARC AI Builder] API Response: {json.dumps(result, ensure_ascii=False, indent=2)}")
             
             if "choices" not in result or len(result["choices"]) == 0:
                 print(f"[ARC AI Builder] No choices in response")
                 return None
-                
-            return result["choices"][0]["message"]["content"]
             
-        except Exception as e:
-            print(f"[ARC AI Builder] OpenAI API调用失败: {str(e)}")
-            import traceback
-            print(f"[ARC AI Builder] Traceback: {traceback.format_exc()}")
+            return result["choices"][0]["message"]["content"]
+        
+        # 逐个解码SSE数据块，拼接增量内容
+        parts = []
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = _loads(data).get("choices")
+            if choices:
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    parts.append(content)
+        
+        if not parts:
+            print(f"[ARC AI Builder] No choices in response")
             return None
+        
+        content = "".join(parts)
+        if self._debug_enabled():
+            self.logger.debug(f"[ARC AI Builder] API Response: {content}")
+        return content
 
     def _parse_response(self, response: str) -> Tuple[List[str], int]:
         """
         解析AI响应，提取指令和成本
         """
         try:
-            # 尝试提取JSON部分
+            # 从第一个 { 开始只解码一个完整的JSON对象，忽略其后的多余文本
             start_idx = response.find('{')
-            end_idx = response.rfind('}') + 1
-            
-            if start_idx == -1 or end_idx == 0:
+            if start_idx == -1:
                 raise ValueError("未找到有效的JSON响应")
             
-            json_str = response[start_idx:end_idx]
-            data = json.loads(json_str)
+            data, _ = _JSON_DECODER.raw_decode(response, start_idx)
+            if not isinstance(data, dict):
+                raise ValueError("未找到有效的JSON响应")
             
             commands = data.get("commands", [])
             estimated_cost = data.get("estimated_cost", 0)
             
             # 验证指令格式
-            validated_commands = []
-            for cmd in commands:
-                if self._validate_command(cmd):
-                    validated_commands.append(cmd)
-                else:
-                    print(f"[ARC AI Builder] 跳过无效指令: {cmd}")
+            validated_commands = [cmd for cmd in commands if _VALID_CMD_RE.match(cmd)]
+            skipped = len(commands) - len(validated_commands)
+            if skipped:
+                print(f"[ARC AI Builder] 跳过 {skipped} 条无效指令")
             
             return validated_commands, estimated_cost
             
@@ -286,18 +409,6 @@ class OpenAIManager:
             print(f"[ARC AI Builder] 解析AI响应失败: {str(e)}")
             return [], 0
 
-    def _validate_command(self, command: str) -> bool:
-        """
-        验证指令格式是否正确
-        """
-        command = command.strip().lower()
-        
-        # 检查是否是fill或setblock命令
-        if command.startswith("fill ") or command.startswith("setblock "):
-            return True
-        
-        return False
-
     def test_connection(self) -> bool:
         """
         测试API连接
@@ -323,3 +434,38 @@ class OpenAIManager:
         except Exception as e:
             print(f"[ARC AI Builder] Connection test error: {str(e)}")
             return False
+
+    def _run_loop(self) -> None:
+        """
+        后台线程入口：运行事件循环，停止后在本线程中关闭事件循环
+        """
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _shutdown(self) -> None:
+        """
+        在事件循环中取消所有未完成的任务（包括合并中的API请求），关闭异步连接后停止事件循环
+        """
+        try:
+            current = asyncio.current_task()
+            tasks = [task for task in asyncio.all_tasks() if task is not current]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.async_session.aclose()
+        except Exception as e:
+            print(f"[ARC AI Builder] 关闭异步连接失败: {str(e)}")
+        finally:
+            self._loop.stop()
+
+    def close(self) -> None:
+        """
+        取消未完成的生成请求，关闭HTTP连接并停止后台事件循环，不等待后台线程退出
+        """
+        # 取消已提交的生成请求，调用方的完成回调会在当前线程中收到取消状态
+        for future in list(self._submitted):
+            future.cancel()
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        self.session.close()
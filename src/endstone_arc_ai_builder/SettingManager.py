@@ -4,12 +4,17 @@ from pathlib import Path
 MAIN_PATH = 'plugins/ARCAIBuilder'
 
 class SettingManager:
-    setting_dict = {}  # Class variable to store all settings
-
     def __init__(self):
+        self.setting_dict = {}  # Settings of this instance
         self.setting_file_path = Path(MAIN_PATH) / "default_settings.txt"
+        self._file_entry_bytes = 0  # Bytes of key=value lines currently in the file
+        self._missing_newline = False  # Whether the file does not end with a newline
         self._load_setting_file()
         self._load_default_settings()
+        # SetSetting only appends, so overwritten keys pile up in the file;
+        # rewrite it once they take more than twice the live settings
+        if self._file_entry_bytes > 2 * self._live_entry_bytes():
+            self.compact()
     
     def _load_default_settings(self):
         """加载默认设置"""
@@ -27,15 +32,19 @@ class SettingManager:
             "ai_model": "gpt-3.5-turbo",
             "ai_max_tokens": "2000",
             "ai_temperature": "0.7",
+            "api_max_concurrency": "4",
             "build_delay": "0.1",
+            "build_batch_size": "1",
             "max_commands_per_build": "1000",
-            "default_language": "CN"
+            "default_language": "CN",
+            "log_level": "INFO",
+            "log_traceback": "false"
         }
         
         # 将默认设置添加到设置字典中
         for key, value in default_settings.items():
-            if key not in SettingManager.setting_dict:
-                SettingManager.setting_dict[key] = value
+            if key not in self.setting_dict:
+                self.setting_dict[key] = value
 
     def _create_default_settings_file(self):
         """创建默认配置文件"""
@@ -61,13 +70,21 @@ min_building_size=1
 ai_model=gpt-3.5-turbo
 ai_max_tokens=2000
 ai_temperature=0.7
+# 同时进行的AI生成请求上限，超出的请求排队等待
+api_max_concurrency=4
 
 # 建造配置
 build_delay=0.1
+build_batch_size=1
 max_commands_per_build=1000
 
 # 语言配置
 default_language=CN
+
+# 日志配置（设为 DEBUG 可输出逐条命令的调试信息）
+log_level=INFO
+# 出错时是否输出异常堆栈（相同异常每分钟最多输出一次）
+log_traceback=false
 """
         with self.setting_file_path.open("w", encoding="utf-8") as f:
             f.write(default_content)
@@ -84,30 +101,49 @@ default_language=CN
         print(f"[ARC AI Builder] Loading settings from: {self.setting_file_path}")
         with self.setting_file_path.open("r", encoding="utf-8") as f:
             for line in f:
+                self._missing_newline = not line.endswith("\n")
                 line = line.strip()
                 if line and "=" in line and not line.startswith("#"):
                     key, value = line.split("=", 1)
-                    SettingManager.setting_dict[key.strip()] = value.strip()
+                    self._file_entry_bytes += len(line) + 1
+                    self.setting_dict[key.strip()] = value.strip()
                     print(f"[ARC AI Builder] Loaded setting: {key.strip()} = {value.strip()}")
         
-        print(f"[ARC AI Builder] Total settings loaded from file: {len(SettingManager.setting_dict)}")
+        print(f"[ARC AI Builder] Total settings loaded from file: {len(self.setting_dict)}")
 
     def GetSetting(self, key):
-        # If key doesn't exist in settings, add it
-        if key not in SettingManager.setting_dict:
-            with self.setting_file_path.open("a", encoding="utf-8") as f:
-                f.write(f"\n{key}=")
-            SettingManager.setting_dict[key] = ""
+        # If key doesn't exist in settings, add it in memory only;
+        # it will be written out on the next flush
+        if key not in self.setting_dict:
+            self.setting_dict[key] = ""
 
-        value = None if not SettingManager.setting_dict[key] else SettingManager.setting_dict[key]
-        print(f"[ARC AI Builder] GetSetting({key}) = {value}")
-        return value
+        return self.setting_dict[key] or None
 
     def SetSetting(self, key, value):
-        # Update setting in memory
-        SettingManager.setting_dict[key] = str(value)
-
-        # Rewrite entire file with updated settings
+        # Update setting in memory, then append it to the file;
+        # later lines override earlier ones when the file is loaded
+        value = str(value)
+        self.setting_dict[key] = value
+        line = f"{key}={value}\n"
+        with self.setting_file_path.open("a", encoding="utf-8") as f:
+            if self._missing_newline:
+                f.write("\n")
+                self._missing_newline = False
+            f.write(line)
+        self._file_entry_bytes += len(line)
+
+    def _live_entry_bytes(self):
+        """计算当前设置全部写出时 key=value 行的总长度"""
+        return sum(len(k) + len(v) + 2 for k, v in self.setting_dict.items())
+
+    def compact(self):
+        """将内存中的全部设置重写到配置文件，去掉被覆盖的旧行"""
+        self.flush()
+
+    def flush(self):
+        """将内存中的全部设置写回配置文件"""
         with self.setting_file_path.open("w", encoding="utf-8") as f:
-            for k, v in SettingManager.setting_dict.items():
-                f.write(f"{k}={v}\n")
\ No newline at end of file
+            for k, v in self.setting_dict.items():
+                f.write(f"{k}={v}\n")
+        self._missing_newline = False
+        self._file_entry_bytes = self._live_entry_bytes()
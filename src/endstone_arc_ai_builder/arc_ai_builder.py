@@ -1,9 +1,16 @@
-import datetime
+import bisect
+import collections
 import os
 import json
-import threading
+import math
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import IntEnum
 from typing import Dict, List, Optional, Tuple
 
+from endstone import Logger
 from endstone.command import Command, CommandSender
 from endstone.event import EventPriority, ServerLoadEvent, event_handler
 from endstone.plugin import Plugin
@@ -14,8 +21,124 @@ from .SettingManager import SettingManager
 from .OpenAIManager import OpenAIManager
 from .CommandExecutor import CommandExecutor
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    _loads = json.loads
+
+# 相同异常的堆栈在该时间（秒）内只输出一次
+_TRACE_DEDUPE_SECONDS = 60.0
+_TRACE_DEDUPE_SIZE = 256
+# 建筑请求缓存的容量上限和有效期（秒），玩家放弃确认的请求到期后自动清理
+_REQUEST_CACHE_SIZE = 2048
+_REQUEST_CACHE_TTL = 900.0
+
+
+class _ExpiringDict:
+    """带容量上限和有效期的字典，条目按写入顺序过期，超出容量时淘汰最早写入的条目"""
+    __slots__ = ('_data', '_maxsize', '_ttl')
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        :param maxsize: 最大条目数
+        :param ttl: 条目有效期（秒）
+        """
+        self._data = collections.OrderedDict()  # {key: (过期时间, value)}
+        self._maxsize = maxsize
+        self._ttl = ttl
+
+    def __setitem__(self, key, value) -> None:
+        data = self._data
+        now = time.monotonic()
+        data.pop(key, None)
+        data[key] = (now + self._ttl, value)
+        # 所有条目有效期相同，最早写入的条目最先过期
+        while data:
+            oldest_key, (expire_time, _) = next(iter(data.items()))
+            if expire_time > now and len(data) <= self._maxsize:
+                break
+            del data[oldest_key]
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return default
+        return entry[1]
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class BuildStatus(IntEnum):
+    """建筑记录状态"""
+    PENDING = 0    # 待确认
+    BUILDING = 1   # 建造中
+    COMPLETED = 2  # 已完成
+    FAILED = 3     # 失败
+    CANCELLED = 4  # 已取消
+
+
+# 建筑已结束的状态，进入这些状态时记录完成时间并清理坐标缓存
+_FINISHED_STATUSES = frozenset((BuildStatus.COMPLETED, BuildStatus.FAILED, BuildStatus.CANCELLED))
+
+
+@dataclass(slots=True)
+class BuildRequest:
+    """玩家的建筑请求（生成中或待确认）"""
+    center_pos: Tuple[int, int, int]
+    dimension: str
+    size: int
+    requirements: str
+    player_name: str = ''
+    commands: Optional[list] = None
+    estimated_cost: Optional[int] = None
+
+
+@dataclass(slots=True)
+class BuildingRecord:
+    """建筑记录"""
+    id: int
+    player_name: str
+    player_uuid: str
+    center_x: int
+    center_y: int
+    center_z: int
+    dimension: str = 'Overworld'
+    size: int = 10
+    requirements: str = ''
+    estimated_cost: int = 0
+    actual_cost: int = 0
+    commands: list = field(default_factory=list)
+    status: BuildStatus = BuildStatus.BUILDING
+    created_time: str = ''
+    completed_time: Optional[str] = None
+
 
 class ARCAIBuilderPlugin(Plugin):
+    # 基类 Plugin 自带 __dict__，这里声明的属性改为槽位访问
+    __slots__ = ('language_manager', 'setting_manager', 'openai_manager', 'command_executor',
+                 'building_records', 'building_coordinates', 'next_building_id',
+                 'player_requests', 'request_positions', 'next_request_id',
+                 'economy_plugin', 'land_manager',
+                 '_log_info', '_log_warning', '_log_error', '_log_debug',
+                 '_cached_size_bounds', '_pending_by_player', '_main_panel_buttons', '_worker_pool',
+                 '_active_building_by_player',
+                 '_pending_progress', '_progress_task', '_last_percent',
+                 '_trace_enabled', '_trace_times')
+
     prefix = "ARCAIBuilderPlugin"
     api_version = "0.10"
     load = "POSTWORLD"
@@ -46,6 +169,7 @@ class ARCAIBuilderPlugin(Plugin):
     def _safe_log(self, level: str, message: str):
         """
         安全的日志记录方法，在logger未初始化时使用print
+        on_enable 之后请直接使用 _log_info/_log_warning/_log_error
         :param level: 日志级别 (info, warning, error)
         :param message: 日志消息
         """
@@ -62,6 +186,19 @@ class ARCAIBuilderPlugin(Plugin):
             # 如果logger未初始化，使用print
             print(f"[{level.upper()}] {message}")
 
+    def _apply_log_level(self) -> None:
+        """
+        按设置项 log_level 调整插件日志器的级别
+        """
+        level_name = (self.setting_manager.GetSetting("log_level") or "").strip().upper()
+        if not level_name:
+            return
+        level = Logger.Level.__members__.get(level_name)
+        if level is None:
+            self._log_warning(f"[ARC AI Builder] 无效的日志级别配置: {level_name}")
+            return
+        self.logger.set_level(level)
+
     def on_load(self) -> None:
         self._safe_log('info', "[ARC AI Builder] on_load is called!")
         
@@ -72,9 +209,14 @@ class ARCAIBuilderPlugin(Plugin):
         self.setting_manager = SettingManager()
         
         # 初始化内存数据存储
-        self.building_records = {}  # 建筑记录 {building_id: record_dict}
+        self.building_records = {}  # 建筑记录 {building_id: BuildingRecord}
+        self._pending_by_player = collections.defaultdict(list)  # 待确认建筑索引 {player_name: [building_id, ...]}，按ID（即创建顺序）升序
+        self._active_building_by_player = {}  # 建造中建筑索引 {player_name: building_id}
         self.building_coordinates = {}  # 建筑坐标缓存 {building_id: (x, y, z)}
+        self._pending_progress = {}  # 待通知的建筑进度 {player_name: (current, total)}
+        self._last_percent = {}  # 上次通知的进度百分比 {player_name: percent}
         self.next_building_id = 1  # 下一个建筑ID
+        self._cached_size_bounds = None  # 建筑范围限制缓存 (min_size, max_size)
         
         # 初始化OpenAI管理器（稍后配置）
         self.openai_manager = None
@@ -83,23 +225,50 @@ class ARCAIBuilderPlugin(Plugin):
         self.command_executor = None
         
         # 玩家建筑请求缓存
-        self.player_requests = {}  # 存储玩家的建筑请求 {player_name: request_data}
-        # 请求位置跟踪 {request_id: (x, y, z, dimension)}
-        self.request_positions = {}  # 存储请求发起时的位置
+        # 两者都有容量上限和有效期，玩家放弃确认的请求不会一直占用内存
+        self.player_requests = _ExpiringDict(_REQUEST_CACHE_SIZE, _REQUEST_CACHE_TTL)  # 存储玩家的建筑请求 {player_name: BuildRequest}
+        # 请求位置跟踪 {request_id: BuildRequest}
+        self.request_positions = _ExpiringDict(_REQUEST_CACHE_SIZE, _REQUEST_CACHE_TTL)  # 存储请求发起时的位置
         self.next_request_id = 1  # 下一个请求ID
+        
 
     def on_enable(self) -> None:
-        self._safe_log('info', "[ARC AI Builder] on_enable is called!")
+        # logger 此时已可用，预先绑定日志方法，避免每次记录日志时再判断级别
+        self._log_info = self.logger.info
+        self._log_warning = self.logger.warning
+        self._log_error = self.logger.error
+        self._log_debug = self.logger.debug
+        # 按设置项 log_level 调整日志级别，插件及各管理器的调试日志统一由该日志器控制
+        self._apply_log_level()
+        # 异常堆栈默认不输出，可通过设置项 log_traceback=true 打开
+        log_traceback = self.setting_manager.GetSetting("log_traceback") or ""
+        self._trace_enabled = log_traceback.strip().lower() in ("1", "true", "yes", "on")
+        self._trace_times = {}  # 最近输出过堆栈的异常 {(异常类型, 异常信息): 输出时间}
+        self._log_info("[ARC AI Builder] on_enable is called!")
         self.register_events(self)
         
+        # 主面板中与位置无关的按钮，只构建一次
+        self._main_panel_buttons = (
+            ("待确认建筑设计", self._show_rebuild_panel),
+            ("关闭", None)
+        )
+        
+        # 共享的后台线程池，用于执行会阻塞的操作（如测试API连接），避免每次新建线程
+        self._worker_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ARCAIBuilderWorker")
+        
         # 初始化命令执行器
         self.command_executor = CommandExecutor(
             server=self.server,
             on_progress=self._on_build_progress,
             on_complete=self._on_build_complete,
             setting_manager=self.setting_manager,
-            plugin_self=self
+            plugin_self=self,
+            logger=self.logger,
+            on_cancel=self._on_build_cancelled
         )
+        
+        # 建筑进度每秒（20 tick）统一通知一次，避免每条命令都刷屏
+        self._progress_task = self.server.scheduler.run_task(self, self._flush_build_progress, delay=20, period=20)
 
         # 初始化经济系统
         self._init_economy_system()
@@ -113,14 +282,27 @@ class ARCAIBuilderPlugin(Plugin):
         self.logger.info(f"[ARC AI Builder] Plugin enabled!")
 
     def on_disable(self) -> None:
-        self._safe_log('info', "[ARC AI Builder] on_disable is called!")
+        self._log_info("[ARC AI Builder] on_disable is called!")
         
         # 停止所有正在执行的建筑任务
         if self.command_executor:
             self.command_executor.stop_execution()
+        self._progress_task.cancel()
+        
+        # 关闭OpenAI连接和后台事件循环
+        if self.openai_manager:
+            self.openai_manager.close()
+            self.openai_manager = None
+        
+        # 关闭后台线程池，不等待未完成的任务
+        self._worker_pool.shutdown(wait=False)
         
         # 清理内存数据（可选）
         self.building_records.clear()
+        self._pending_by_player.clear()
+        self._active_building_by_player.clear()
+        self._pending_progress.clear()
+        self._last_percent.clear()
         self.request_positions.clear()
     
     def on_command(self, sender: CommandSender, command: Command, args: list[str]) -> bool:
@@ -142,15 +324,9 @@ class ARCAIBuilderPlugin(Plugin):
     def _show_rebuild_panel(self, player):
         """显示待确认建筑设计面板 - 让玩家重新调出AI规划好的弹窗"""
         try:
-            # 从内存中查询玩家的待确认建筑记录（只查询pending状态的）
-            records = []
-            for building_id, record in self.building_records.items():
-                if record['player_name'] == player.name and record['status'] == 'pending':
-                    records.append(record)
-            
-            # 按创建时间倒序排列
-            records.sort(key=lambda x: x['created_time'], reverse=True)
-            records = records[:10]  # 限制最多10条
+            # 从待确认索引中取该玩家最新的记录，按创建时间倒序，限制最多10条
+            pending_ids = self._pending_by_player.get(player.name) or []
+            records = [self.building_records[building_id] for building_id in reversed(pending_ids[-10:])]
             
             if not records:
                 player.send_message("❌ 没有找到待确认的建筑设计！")
@@ -162,13 +338,14 @@ class ARCAIBuilderPlugin(Plugin):
                 content=f"找到 {len(records)} 条待确认的建筑设计：\n\n请选择要重新查看的建筑："
             )
             
-            import json
-            for i, record in enumerate(records):
+            for record in records:
+                # 指令列表只解析一次并写回记录，之后打开面板或点击按钮都直接复用
+                if isinstance(record.commands, str):
+                    record.commands = _loads(record.commands)
+                # 记录中的坐标在保存时已取整，可直接使用
                 panel.add_button(
-                    text=f"建筑 #{record['id']} - 待确认\n位置: ({int(record['center_x'])}, {int(record['center_y'])}, {int(record['center_z'])})\n需求: {record['requirements'][:20]}...",
-                    on_click=lambda s, r=record: self._show_build_confirm_panel(s, 
-                        json.loads(r['commands']) if isinstance(r['commands'], str) else r['commands'], 
-                        r['estimated_cost'], r)
+                    text=f"建筑 #{record.id} - 待确认\n位置: ({record.center_x}, {record.center_y}, {record.center_z})\n需求: {record.requirements[:20]}...",
+                    on_click=lambda s, r=record: self._show_build_confirm_panel(s, r.commands, r.estimated_cost, r)
                 )
             
             panel.add_button(
@@ -179,118 +356,44 @@ class ARCAIBuilderPlugin(Plugin):
             player.send_form(panel)
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Show rebuild panel error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Show rebuild panel error: {str(e)}")
             player.send_message("❌ 调出建筑规划时出错！")
     
     def _confirm_building_with_record(self, player, commands, estimated_cost, record):
         """从记录确认建造（会删除原记录）"""
         try:
-            # 检查余额
-            player_money = self._get_player_money(player.name)
-            if player_money < estimated_cost:
-                player.send_message("余额不足，无法建造！")
-                return
-            
-            # 扣费
-            if not self._deduct_money(player.name, estimated_cost):
-                player.send_message("扣费失败，无法建造！")
-                return
-            
             # 验证原始记录中的坐标信息
-            if not record or 'center_x' not in record or 'center_y' not in record or 'center_z' not in record:
-                # 扣费失败，退款
-                self._add_money(player.name, estimated_cost)
-                player.send_message("❌ 建筑记录坐标信息缺失，无法建造！已退款。")
+            if record is None:
+                player.send_message("❌ 建筑记录坐标信息缺失，无法建造！")
                 return
             
             # 使用原始记录中的坐标
-            import math
-            center_pos = (math.floor(record['center_x']), math.floor(record['center_y']), math.floor(record['center_z']))
-            dimension = record.get('dimension', 'Overworld')
-            size = record.get('size', 10)
-            requirements = record.get('requirements', '重新确认的建筑')
-            
-            # 创建建筑记录
-            request = {
-                'center_pos': center_pos,
-                'dimension': dimension,
-                'size': size,
-                'requirements': requirements,
-                'commands': commands,
-                'estimated_cost': estimated_cost
-            }
-            
-            # 保存建筑记录
-            building_id = self._save_building_record(player, request)
-            if not building_id:
-                # 扣费失败，退款
-                self._add_money(player.name, estimated_cost)
-                player.send_message("保存建筑记录失败，已退款。")
+            center_pos = (record.center_x, record.center_y, record.center_z)
+            request = BuildRequest(
+                center_pos=center_pos,
+                dimension=record.dimension,
+                size=record.size,
+                requirements=record.requirements or '重新确认的建筑',
+                player_name=player.name,
+                commands=commands,
+                estimated_cost=estimated_cost
+            )
+            
+            if not self._perform_confirm(player, request):
                 return
             
             # 删除原记录（从内存中删除）
-            if record['id'] in self.building_records:
-                del self.building_records[record['id']]
-                self._safe_log('info', f"[ARC AI Builder] Deleted original record {record['id']} from memory")
-            
-            # 开始执行建筑指令
-            self._execute_building_commands(player, commands, building_id)
+            if record.id in self.building_records:
+                self._unindex_pending(self.building_records.pop(record.id))
+                self._log_info(f"[ARC AI Builder] Deleted original record {record.id} from memory")
             
             # 显示开始建造消息
-            player.send_message(f"✅ 建造已开始！预计成本：{estimated_cost:,} 元")
-            player.send_message(f"📍 建筑位置：({center_pos[0]}, {center_pos[1]}, {center_pos[2]})")
+            player.send_message(f"✅ 建造已开始！预计成本：{estimated_cost:,} 元\n📍 建筑位置：({center_pos[0]}, {center_pos[1]}, {center_pos[2]})")
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Confirm building with record error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Confirm building with record error: {str(e)}")
             player.send_message("确认建造时出错，请重试。")
     
-    def _execute_building_commands_direct(self, player, commands, building_id, center_pos):
-        """直接执行建筑指令（使用传入的坐标）"""
-        try:
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands direct - player: {player.name}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands direct - commands count: {len(commands) if commands else 0}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands direct - building_id: {building_id}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands direct - center_pos: {center_pos}")
-            
-            # 验证参数
-            if commands is None:
-                self._safe_log('error', "[ARC AI Builder] Execute building commands direct - commands is None")
-                player.send_message("建筑指令为空，无法执行！")
-                self._update_building_status(building_id, 'failed')
-                return
-            
-            if not isinstance(commands, list):
-                self._safe_log('error', f"[ARC AI Builder] Execute building commands direct - commands is not list: {type(commands)}")
-                player.send_message("建筑指令格式错误，无法执行！")
-                self._update_building_status(building_id, 'failed')
-                return
-            
-            if building_id is None:
-                self._safe_log('error', "[ARC AI Builder] Execute building commands direct - building_id is None")
-                player.send_message("建筑记录ID错误，无法执行！")
-                return
-            
-            if center_pos is None:
-                self._safe_log('error', "[ARC AI Builder] Execute building commands direct - center_pos is None")
-                player.send_message("建筑位置错误，无法执行！")
-                self._update_building_status(building_id, 'failed')
-                return
-            
-            # 使用命令执行器异步执行指令
-            self.command_executor.execute_commands_async(commands, player.name, center_pos)
-            
-            # 更新建筑状态为建造中
-            self._update_building_status(building_id, 'building')
-            
-            # 显示进度提示
-            player.send_message("🏗️ 建筑指令已开始执行，请耐心等待...")
-            
-        except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Execute building commands direct error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Execute building commands direct traceback: {traceback.format_exc()}")
-            player.send_message("执行建筑指令时出错，请重试。")
-
     # 内存数据管理方法
     
     def _init_economy_system(self) -> None:
@@ -330,30 +433,73 @@ class ARCAIBuilderPlugin(Plugin):
         # 保存配置到SettingManager
         self.setting_manager.SetSetting("openai_api_key", openai_key)
         self.setting_manager.SetSetting("openai_api_url", api_url)
+        self._cached_size_bounds = None
         
-        # 初始化OpenAI管理器
-        self.openai_manager = OpenAIManager(openai_key, api_url, self.setting_manager)
+        # 初始化OpenAI管理器（先关闭旧的连接）
+        if self.openai_manager:
+            self.openai_manager.close()
+        self.openai_manager = OpenAIManager(openai_key, api_url, self.setting_manager, logger=self.logger)
         
-        # 测试连接
-        if self.openai_manager.test_connection():
-            sender.send_message("✓ AI建筑师配置成功！OpenAI API连接正常。")
-            self._safe_log('info', "[ARC AI Builder] OpenAI configuration successful")
-        else:
-            sender.send_message("✗ AI建筑师配置失败！请检查API密钥和网络连接。")
-            self._safe_log('error', "[ARC AI Builder] OpenAI configuration failed")
+        # 在后台线程中测试连接，避免阻塞服务器主线程
+        openai_manager = self.openai_manager
+        sender.send_message("正在测试OpenAI API连接...")
+        
+        def test_connection():
+            ok = openai_manager.test_connection()
+            
+            # 回到主线程通知结果
+            def report():
+                if ok:
+                    sender.send_message("✓ AI建筑师配置成功！OpenAI API连接正常。")
+                    self._log_info("[ARC AI Builder] OpenAI configuration successful")
+                else:
+                    sender.send_message("✗ AI建筑师配置失败！请检查API密钥和网络连接。")
+                    self._log_error("[ARC AI Builder] OpenAI configuration failed")
+            
+            self.server.scheduler.run_task(self, report, delay=0)
+        
+        self._worker_pool.submit(test_connection).add_done_callback(self._log_worker_error)
         
         return True
     
+    def _log_traceback(self, context: str, error: Exception) -> None:
+        """
+        在 except 块中输出当前异常的堆栈，仅在开启 log_traceback 时输出，
+        相同的异常在 _TRACE_DEDUPE_SECONDS 秒内只输出一次
+        :param context: 出错位置的描述
+        :param error: 捕获到的异常
+        """
+        if not self._trace_enabled:
+            return
+        key = (type(error), str(error))
+        now = time.monotonic()
+        last_time = self._trace_times.get(key)
+        if last_time is not None and now - last_time < _TRACE_DEDUPE_SECONDS:
+            return
+        if len(self._trace_times) >= _TRACE_DEDUPE_SIZE:
+            self._trace_times.clear()
+        self._trace_times[key] = now
+        self._log_error(f"[ARC AI Builder] {context} traceback: {traceback.format_exc()}")
+    
+    def _log_worker_error(self, future):
+        """
+        记录后台线程池任务中未捕获的异常，避免异常在线程中被静默丢弃
+        :param future: 已完成的任务
+        """
+        error = future.exception()
+        if error is not None:
+            self._log_error(f"[ARC AI Builder] Background task error: {str(error)}")
+    
     def _load_openai_config(self) -> None:
         """加载OpenAI配置"""
         api_key = self.setting_manager.GetSetting("openai_api_key")
         api_url = self.setting_manager.GetSetting("openai_api_url") or "https://api.openai.com/v1"
         
         if api_key:
-            self.openai_manager = OpenAIManager(api_key, api_url, self.setting_manager)
-            self._safe_log('info', "[ARC AI Builder] OpenAI configuration loaded from settings")
+            self.openai_manager = OpenAIManager(api_key, api_url, self.setting_manager, logger=self.logger)
+            self._log_info("[ARC AI Builder] OpenAI configuration loaded from settings")
         else:
-            self._safe_log('warning', "[ARC AI Builder] No OpenAI configuration found. Please use /aibuilderconfig to configure.")
+            self._log_warning("[ARC AI Builder] No OpenAI configuration found. Please use /aibuilderconfig to configure.")
     
     # 用户界面相关方法
     def _show_ai_builder_panel(self, player):
@@ -371,7 +517,6 @@ class ARCAIBuilderPlugin(Plugin):
             
             # 获取玩家当前位置
             location = player.location
-            import math
             center_pos = (math.floor(location.x), math.floor(location.y), math.floor(location.z))
             dimension = location.dimension.name
             
@@ -381,49 +526,31 @@ class ARCAIBuilderPlugin(Plugin):
                 content=f"当前位置: ({center_pos[0]}, {center_pos[1]}, {center_pos[2]})\n维度: {dimension}\n\n请选择操作："
             )
             
-            # 添加开始建造按钮
+            # 添加开始建造按钮（依赖当前位置，每次单独创建）
             main_panel.add_button(
                 "开始建造",
                 on_click=lambda sender: self._show_build_input_panel(sender, center_pos, dimension)
             )
             
-            # 添加待确认建筑设计按钮
-            main_panel.add_button(
-                "待确认建筑设计",
-                on_click=lambda sender: self._show_rebuild_panel(sender)
-            )
-            
-            # 添加关闭按钮
-            main_panel.add_button(
-                "关闭",
-                on_click=lambda sender: None
-            )
+            # 添加待确认建筑设计按钮和关闭按钮
+            for text, handler in self._main_panel_buttons:
+                main_panel.add_button(text, on_click=handler)
             
             player.send_form(main_panel)
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Show main panel error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Show main panel error: {str(e)}")
             player.send_message("显示面板时出错，请重试。")
     
     def _show_build_input_panel(self, player, center_pos, dimension):
         """显示建造输入面板"""
         try:
-            # 获取范围限制，添加详细的调试信息
-            min_size_setting = self.setting_manager.GetSetting("min_building_size")
-            max_size_setting = self.setting_manager.GetSetting("max_building_size")
-            
-            self._safe_log('info', f"[ARC AI Builder] Build input panel - min_size_setting: {min_size_setting}, max_size_setting: {max_size_setting}")
-            
-            # 安全地转换设置值
-            try:
-                min_size = int(min_size_setting) if min_size_setting is not None else 1
-                max_size = int(max_size_setting) if max_size_setting is not None else 64
-            except (ValueError, TypeError) as e:
-                self._safe_log('error', f"[ARC AI Builder] Build input panel - Error converting size settings: {str(e)}")
-                min_size = 1
-                max_size = 64
+            debug = self.logger.is_enabled_for(Logger.Level.DEBUG)
+            # 获取范围限制
+            min_size, max_size = self._get_size_bounds()
             
-            self._safe_log('info', f"[ARC AI Builder] Build input panel - Final min_size: {min_size}, max_size: {max_size}")
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Build input panel - Final min_size: {min_size}, max_size: {max_size}")
             
             # 创建输入表单
             size_input = TextInput(
@@ -439,199 +566,49 @@ class ARCAIBuilderPlugin(Plugin):
             )
             
             # 添加调试信息
-            self._safe_log('info', f"[ARC AI Builder] Build input panel - Created size_input: {size_input}")
-            self._safe_log('info', f"[ARC AI Builder] Build input panel - Created requirements_input: {requirements_input}")
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Build input panel - Created size_input: {size_input}")
+                self._log_debug(f"[ARC AI Builder] Build input panel - Created requirements_input: {requirements_input}")
             
             def handle_build_submit(sender, *args, **kwargs):
                 try:
+                    debug = self.logger.is_enabled_for(Logger.Level.DEBUG)
                     # 添加详细的调试信息
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Sender: {sender}")
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Args: {args}")
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Kwargs: {kwargs}")
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Args count: {len(args)}")
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Kwargs keys: {list(kwargs.keys())}")
+                    if debug:
+                        self._log_debug(f"[ARC AI Builder] Build submit - Sender: {sender}")
+                        self._log_debug(f"[ARC AI Builder] Build submit - Args: {args}")
+                        self._log_debug(f"[ARC AI Builder] Build submit - Kwargs: {kwargs}")
                     
                     # 处理不同的参数格式
-                    form_data = None
                     if len(args) > 0:
                         form_data = args[0]
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - Using first arg as form_data: {form_data}")
                     elif 'form_data' in kwargs:
                         form_data = kwargs['form_data']
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - Using form_data from kwargs: {form_data}")
                     elif 'data' in kwargs:
                         form_data = kwargs['data']
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - Using data from kwargs: {form_data}")
                     else:
-                        self._safe_log('error', "[ARC AI Builder] Build submit - No form data found in args or kwargs")
-                        self._safe_log('error', f"[ARC AI Builder] Build submit - Available kwargs: {list(kwargs.keys())}")
-                        error_form = ActionForm(
-                            title="输入错误",
-                            content="无法获取表单数据，请重试。",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(error_form)
-                        return
-                    
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Form data: {form_data}")
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Form data type: {type(form_data)}")
-                    
-                    # 处理不同的数据格式
-                    if isinstance(form_data, str):
-                        # 如果是JSON字符串，解析它
-                        try:
-                            data = json.loads(form_data)
-                            self._safe_log('info', f"[ARC AI Builder] Build submit - Parsed JSON data: {data}")
-                        except json.JSONDecodeError as je:
-                            self._safe_log('error', f"[ARC AI Builder] Build submit - JSON decode error: {str(je)}")
-                            error_form = ActionForm(
-                                title="输入错误",
-                                content="输入数据格式错误，请重试。",
-                                on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                            )
-                            sender.send_form(error_form)
-                            return
-                    elif isinstance(form_data, (list, tuple)):
-                        # 如果直接是列表或元组
-                        data = form_data
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - Direct list data: {data}")
-                    else:
-                        # 其他格式，尝试转换
-                        self._safe_log('error', f"[ARC AI Builder] Build submit - Unexpected data format: {type(form_data)}")
-                        error_form = ActionForm(
-                            title="输入错误",
-                            content="输入数据格式错误，请重试。",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(error_form)
-                        return
-                    
-                    # 验证数据长度
-                    if not isinstance(data, (list, tuple)) or len(data) < 3:
-                        self._safe_log('error', f"[ARC AI Builder] Build submit - Invalid data format: {data}")
-                        error_form = ActionForm(
-                            title="输入错误",
-                            content="输入数据格式错误，请重试。",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(error_form)
+                        self._log_error(f"[ARC AI Builder] Build submit - No form data found, available kwargs: {list(kwargs.keys())}")
+                        self._send_input_error(sender, "无法获取表单数据，请重试。", center_pos, dimension)
                         return
                     
-                    # 数据格式: [Label, size_input, requirements_input]
-                    # 所以索引应该是: data[1] = size_str, data[2] = requirements
-                    size_str = data[1]  # 范围输入 (第二个元素)
-                    requirements = data[2]  # 需求输入 (第三个元素)
-                    
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Corrected size_str: '{size_str}' (type: {type(size_str)})")
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Corrected requirements: '{requirements}' (type: {type(requirements)})")
-                    
-                    # 验证size_str不为None
-                    if size_str is None:
-                        self._safe_log('error', "[ARC AI Builder] Build submit - size_str is None")
-                        error_form = ActionForm(
-                            title="输入错误",
-                            content="建筑范围不能为空！",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(error_form)
+                    # 一次完成解析和验证，返回第一个错误
+                    error_msg, parsed = self._validate_build_submit(form_data)
+                    if error_msg:
+                        self._log_error(f"[ARC AI Builder] Build submit - Invalid input: {error_msg} (form_data: {form_data})")
+                        self._send_input_error(sender, error_msg, center_pos, dimension)
                         return
+                    size, requirements = parsed
                     
-                    # 验证requirements不为None
-                    if requirements is None:
-                        self._safe_log('error', "[ARC AI Builder] Build submit - requirements is None")
-                        error_form = ActionForm(
-                            title="输入错误",
-                            content="建筑需求不能为空！",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(error_form)
-                        return
-                    
-                    # 验证范围
-                    try:
-                        # 确保size_str是字符串
-                        if not isinstance(size_str, str):
-                            size_str = str(size_str)
-                        
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - Converting size_str to int: '{size_str}'")
-                        size = int(size_str)
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - Converted size: {size}")
-                        
-                        # 获取范围限制，添加None检查
-                        min_size_setting = self.setting_manager.GetSetting("min_building_size")
-                        max_size_setting = self.setting_manager.GetSetting("max_building_size")
-                        
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - min_size_setting: {min_size_setting}, max_size_setting: {max_size_setting}")
-                        
-                        min_size = int(min_size_setting) if min_size_setting is not None else 1
-                        max_size = int(max_size_setting) if max_size_setting is not None else 64
-                        
-                        self._safe_log('info', f"[ARC AI Builder] Build submit - Final min_size: {min_size}, max_size: {max_size}")
-                        
-                        if size < min_size or size > max_size:
-                            raise ValueError(f"范围必须在{min_size}-{max_size}之间")
-                            
-                    except ValueError as ve:
-                        self._safe_log('error', f"[ARC AI Builder] Build submit - ValueError in size validation: {str(ve)}")
-                        min_size = int(self.setting_manager.GetSetting("min_building_size") or "1")
-                        max_size = int(self.setting_manager.GetSetting("max_building_size") or "64")
-                        result_form = ActionForm(
-                            title="输入错误",
-                            content=f"建筑范围必须是{min_size}-{max_size}之间的数字！",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(result_form)
-                        return
-                    except Exception as e:
-                        self._safe_log('error', f"[ARC AI Builder] Build submit - Unexpected error in size validation: {str(e)}")
-                        error_form = ActionForm(
-                            title="输入错误",
-                            content=f"处理建筑范围时出错：{str(e)}",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(error_form)
-                        return
-                    
-                    # 验证需求
-                    if not isinstance(requirements, str):
-                        self._safe_log('error', f"[ARC AI Builder] Build submit - requirements is not string: {type(requirements)}")
-                        error_form = ActionForm(
-                            title="输入错误",
-                            content="建筑需求必须是文本！",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(error_form)
-                        return
-                    
-                    if not requirements.strip():
-                        self._safe_log('error', "[ARC AI Builder] Build submit - requirements is empty")
-                        result_form = ActionForm(
-                            title="输入错误", 
-                            content="请描述你的建筑需求！",
-                            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                        )
-                        sender.send_form(result_form)
-                        return
-                    
-                    # 添加最终验证的调试信息
-                    self._safe_log('info', f"[ARC AI Builder] Build submit - Final validation passed. size: {size}, requirements: '{requirements}'")
+                    if debug:
+                        self._log_debug(f"[ARC AI Builder] Build submit - Final validation passed. size: {size}, requirements: '{requirements}'")
                     
                     # 开始生成建筑指令
                     self._start_building_generation(sender, center_pos, dimension, size, requirements)
                     
-                except json.JSONDecodeError as je:
-                    self._safe_log('error', f"[ARC AI Builder] Build submit - JSON decode error: {str(je)}")
-                    error_form = ActionForm(
-                        title="输入错误",
-                        content="输入数据格式错误，请重试。",
-                        on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
-                    )
-                    sender.send_form(error_form)
                 except Exception as e:
-                    self._safe_log('error', f"[ARC AI Builder] Build input submit error: {str(e)}")
-                    self._safe_log('error', f"[ARC AI Builder] Build input submit error type: {type(e)}")
-                    import traceback
-                    self._safe_log('error', f"[ARC AI Builder] Build input submit traceback: {traceback.format_exc()}")
+                    self._log_error(f"[ARC AI Builder] Build input submit error: {str(e)}")
+                    self._log_error(f"[ARC AI Builder] Build input submit error type: {type(e)}")
+                    self._log_traceback("Build input submit", e)
                     error_form = ActionForm(
                         title="错误",
                         content=f"处理输入时出错：{str(e)}\n请重试。",
@@ -653,22 +630,95 @@ class ARCAIBuilderPlugin(Plugin):
             player.send_form(build_input_panel)
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Show build input panel error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Show build input panel error: {str(e)}")
             player.send_message("显示输入面板时出错，请重试。")
     
+    def _validate_build_submit(self, form_data) -> Tuple[Optional[str], Optional[Tuple[int, str]]]:
+        """
+        解析并验证建造输入表单数据，遇到第一个错误即返回
+        :param form_data: 表单数据，JSON字符串或列表 [Label, 建筑范围, 建筑需求]
+        :return: (错误信息, (建筑范围, 建筑需求))，验证通过时错误信息为None
+        """
+        # 处理不同的数据格式
+        if type(form_data) is str:
+            try:
+                data = _loads(form_data)
+            except json.JSONDecodeError:
+                return "输入数据格式错误，请重试。", None
+        else:
+            data = form_data
+        
+        # 数据格式: [Label, size_input, requirements_input]
+        if not isinstance(data, (list, tuple)) or len(data) < 3:
+            return "输入数据格式错误，请重试。", None
+        size_str = data[1]
+        requirements = data[2]
+        
+        if size_str is None:
+            return "建筑范围不能为空！", None
+        if requirements is None:
+            return "建筑需求不能为空！", None
+        
+        # 验证范围
+        min_size, max_size = self._get_size_bounds()
+        try:
+            size = int(str(size_str))
+        except ValueError:
+            size = None
+        if size is None or size < min_size or size > max_size:
+            return f"建筑范围必须是{min_size}-{max_size}之间的数字！", None
+        
+        # 验证需求
+        if type(requirements) is not str:
+            return "建筑需求必须是文本！", None
+        if not requirements.strip():
+            return "请描述你的建筑需求！", None
+        
+        return None, (size, requirements)
+    
+    def _get_size_bounds(self) -> Tuple[int, int]:
+        """
+        获取建筑范围限制，解析结果会缓存到配置变更为止
+        :return: (最小范围, 最大范围)
+        """
+        if self._cached_size_bounds is None:
+            min_size_setting = self.setting_manager.GetSetting("min_building_size")
+            max_size_setting = self.setting_manager.GetSetting("max_building_size")
+            try:
+                min_size = int(min_size_setting) if min_size_setting is not None else 1
+                max_size = int(max_size_setting) if max_size_setting is not None else 64
+            except (ValueError, TypeError) as e:
+                self._log_error(f"[ARC AI Builder] Error converting size settings: {str(e)}")
+                min_size = 1
+                max_size = 64
+            self._cached_size_bounds = (min_size, max_size)
+        return self._cached_size_bounds
+    
+    def _send_input_error(self, player, content, center_pos, dimension):
+        """
+        显示输入错误提示，关闭后返回建造输入面板
+        :param player: 玩家
+        :param content: 错误提示内容
+        :param center_pos: 建筑中心位置
+        :param dimension: 维度
+        """
+        player.send_form(ActionForm(
+            title="输入错误",
+            content=content,
+            on_close=lambda s: self._show_build_input_panel(s, center_pos, dimension)
+        ))
+    
     def _start_building_generation(self, player, center_pos, dimension, size, requirements):
         """开始生成建筑指令"""
         try:
-            # 添加参数验证和调试信息
-            self._safe_log('info', f"[ARC AI Builder] Start building generation - player: {player.name}")
-            self._safe_log('info', f"[ARC AI Builder] Start building generation - center_pos: {center_pos}")
-            self._safe_log('info', f"[ARC AI Builder] Start building generation - dimension: {dimension}")
-            self._safe_log('info', f"[ARC AI Builder] Start building generation - size: {size} (type: {type(size)})")
-            self._safe_log('info', f"[ARC AI Builder] Start building generation - requirements: '{requirements}' (type: {type(requirements)})")
+            # 调试信息只在开启 DEBUG 时构建，回调中同样沿用该开关
+            debug = self.logger.is_enabled_for(Logger.Level.DEBUG)
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Start building generation - player: {player.name}, center_pos: {center_pos}, dimension: {dimension}, size: {size}, requirements: '{requirements}'")
             
             # 验证参数
             if size is None:
-                self._safe_log('error', "[ARC AI Builder] Start building generation - size is None")
+                self._log_error("[ARC AI Builder] Start building generation - size is None")
                 error_form = ActionForm(
                     title="错误",
                     content="建筑范围参数错误！",
@@ -678,7 +728,7 @@ class ARCAIBuilderPlugin(Plugin):
                 return
             
             if requirements is None:
-                self._safe_log('error', "[ARC AI Builder] Start building generation - requirements is None")
+                self._log_error("[ARC AI Builder] Start building generation - requirements is None")
                 error_form = ActionForm(
                     title="错误",
                     content="建筑需求参数错误！",
@@ -690,10 +740,8 @@ class ARCAIBuilderPlugin(Plugin):
             # 检查是否处于别人的领地区域
             if self.land_manager is not None:
                 try:
-                    import math
-                    # 获取玩家XUID（若不可用则为None）
-                    online_player = self.server.get_player(player.name)
-                    player_xuid = getattr(online_player, 'xuid', None) if online_player is not None else None
+                    # 获取玩家XUID（若不可用则为None），表单回调传入的即为在线玩家，无需再次查找
+                    player_xuid = getattr(player, 'xuid', None)
                     # 计算方形范围（包含边界）：[cx-size, cx+size] × [cz-size, cz+size]
                     cx, cy, cz = center_pos
                     min_x = math.floor(cx - size)
@@ -722,11 +770,10 @@ class ARCAIBuilderPlugin(Plugin):
                             break
                     if forbidden_land is not None:
                         land_name = forbidden_land.get('land_name') or '未知领地'
-                        player.send_message(f"该建造范围包含他人领地: {land_name}，已阻止建造。")
-                        player.send_message("如需在该区域建造，请联系领地主人或被设为共享成员。")
+                        player.send_message(f"该建造范围包含他人领地: {land_name}，已阻止建造。\n如需在该区域建造，请联系领地主人或被设为共享成员。")
                         return
                 except Exception as land_e:
-                    self._safe_log('error', f"[ARC AI Builder] Land check error: {str(land_e)}")
+                    self._log_error(f"[ARC AI Builder] Land check error: {str(land_e)}")
                     # 领地检查失败时，出于安全起见阻止建造，避免误伤
                     player.send_message("领地系统检查失败，已阻止建造以避免破坏他人领地。")
                     return
@@ -736,92 +783,109 @@ class ARCAIBuilderPlugin(Plugin):
             self.next_request_id += 1
             
             # 记录请求发起时的位置
-            self.request_positions[request_id] = {
-                'center_pos': center_pos,
-                'dimension': dimension,
-                'size': size,
-                'requirements': requirements,
-                'player_name': player.name
-            }
+            self.request_positions[request_id] = BuildRequest(
+                center_pos=center_pos,
+                dimension=dimension,
+                size=size,
+                requirements=requirements,
+                player_name=player.name
+            )
             
-            self._safe_log('info', f"[ARC AI Builder] Recorded request {request_id} with position: {center_pos}")
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Recorded request {request_id} with position: {center_pos}")
             
             # 发送生成中提示消息
             player.send_message("AI建筑师正在分析你的需求并生成建筑指令，请稍候...")
             
-            # 在子线程中调用OpenAI API
-            def generate_in_thread():
+            # OpenAI API返回后的处理（在OpenAI管理器的事件循环线程中回调）
+            def on_generated(future):
+                if future.cancelled():
+                    # 只有 OpenAIManager.close() 会取消生成请求，它在主线程中调用，
+                    # 回调同步执行，此时插件可能正在停用，直接通知玩家而不经调度器
+                    self.request_positions.pop(request_id, None)
+                    try:
+                        player.send_message("AI建筑师已关闭或重新配置，本次建筑生成已取消，请稍后重新提交。")
+                    except Exception as cancel_e:
+                        self._log_error(f"[ARC AI Builder] Cancel notification error: {str(cancel_e)}")
+                    return
                 try:
-                    self._safe_log('info', f"[ARC AI Builder] Generate thread - Calling OpenAI with size: {size}, requirements: '{requirements}'")
+                    success, error_msg, commands, estimated_cost = future.result()
                     
-                    success, error_msg, commands, estimated_cost = self.openai_manager.generate_building_commands(
-                        center_pos, size, requirements, player.name
-                    )
-                    
-                    self._safe_log('info', f"[ARC AI Builder] Generate thread - OpenAI result: success={success}, error_msg={error_msg}, commands_count={len(commands) if commands else 0}, estimated_cost={estimated_cost}")
+                    if debug:
+                        self._log_debug(f"[ARC AI Builder] Generate thread - OpenAI result: success={success}, error_msg={error_msg}, commands_count={len(commands) if commands else 0}, estimated_cost={estimated_cost}")
                     
                     # 使用服务器主线程来更新UI，避免线程安全问题
                     def update_ui():
                         try:
-                            self._safe_log('info', f"[ARC AI Builder] Update UI - success: {success}")
+                            if debug:
+                                self._log_debug(f"[ARC AI Builder] Update UI - success: {success}")
                             if success:
                                 # 缓存玩家请求
-                                self.player_requests[player.name] = {
-                                    'center_pos': center_pos,
-                                    'dimension': dimension,
-                                    'size': size,
-                                    'requirements': requirements,
-                                    'commands': commands,
-                                    'estimated_cost': estimated_cost
-                                }
+                                self.player_requests[player.name] = BuildRequest(
+                                    center_pos=center_pos,
+                                    dimension=dimension,
+                                    size=size,
+                                    requirements=requirements,
+                                    player_name=player.name,
+                                    commands=commands,
+                                    estimated_cost=estimated_cost
+                                )
                                 
-                                self._safe_log('info', f"[ARC AI Builder] Update UI - Showing confirm panel for {player.name}")
+                                if debug:
+                                    self._log_debug(f"[ARC AI Builder] Update UI - Showing confirm panel for {player.name}")
                                 # 发送成功消息
                                 player.send_message("AI建筑师已完成建筑方案设计！")
                                 # 显示确认面板，传递请求ID
                                 self._show_build_confirm_panel(player, commands, estimated_cost, request_id=request_id)
                             else:
-                                self._safe_log('info', f"[ARC AI Builder] Update UI - Showing error message for {player.name}")
+                                if debug:
+                                    self._log_debug(f"[ARC AI Builder] Update UI - Showing error message for {player.name}")
+                                # 生成失败的请求不会再被确认，立即清理
+                                self.request_positions.pop(request_id)
                                 # 发送错误消息
-                                player.send_message(f"AI生成建筑指令失败：{error_msg}")
-                                player.send_message("请重新尝试或联系管理员。")
+                                player.send_message(f"AI生成建筑指令失败：{error_msg}\n请重新尝试或联系管理员。")
                         except Exception as ui_e:
-                            self._safe_log('error', f"[ARC AI Builder] UI update error: {str(ui_e)}")
-                            import traceback
-                            self._safe_log('error', f"[ARC AI Builder] UI update traceback: {traceback.format_exc()}")
+                            self._log_error(f"[ARC AI Builder] UI update error: {str(ui_e)}")
+                            self._log_traceback("UI update", ui_e)
                             player.send_message("更新界面时出错，请重试。")
                     
                     # 在主线程中执行UI更新
-                    self._safe_log('info', f"[ARC AI Builder] Scheduling UI update task")
+                    if debug:
+                        self._log_debug(f"[ARC AI Builder] Scheduling UI update task")
                     self.server.scheduler.run_task(self, update_ui, delay=0)
                         
                 except Exception as e:
-                    self._safe_log('error', f"[ARC AI Builder] Generate building commands error: {str(e)}")
-                    self._safe_log('error', f"[ARC AI Builder] Generate building commands error type: {type(e)}")
-                    import traceback
-                    self._safe_log('error', f"[ARC AI Builder] Generate building commands traceback: {traceback.format_exc()}")
+                    self._log_error(f"[ARC AI Builder] Generate building commands error: {str(e)}")
+                    self._log_error(f"[ARC AI Builder] Generate building commands error type: {type(e)}")
+                    self._log_traceback("Generate building commands", e)
+                    # except 块结束后 e 会被删除，闭包只能引用提前保存的错误信息
+                    error_text = str(e)
                     
                     def show_error():
+                        # 生成失败的请求不会再被确认，立即清理
+                        self.request_positions.pop(request_id)
                         try:
-                            self._safe_log('info', f"[ARC AI Builder] Show error - Showing error message for {player.name}")
-                            player.send_message(f"生成建筑指令时发生错误：{str(e)}")
-                            player.send_message("请重新尝试或联系管理员。")
+                            if debug:
+                                self._log_debug(f"[ARC AI Builder] Show error - Showing error message for {player.name}")
+                            player.send_message(f"生成建筑指令时发生错误：{error_text}\n请重新尝试或联系管理员。")
                         except Exception as ui_e:
-                            self._safe_log('error', f"[ARC AI Builder] Error UI update error: {str(ui_e)}")
-                            import traceback
-                            self._safe_log('error', f"[ARC AI Builder] Error UI update traceback: {traceback.format_exc()}")
+                            self._log_error(f"[ARC AI Builder] Error UI update error: {str(ui_e)}")
+                            self._log_traceback("Error UI update", ui_e)
                             player.send_message("显示错误信息时出错，请重试。")
                     
                     # 在主线程中执行错误UI更新
-                    self._safe_log('info', f"[ARC AI Builder] Scheduling error UI update task")
+                    if debug:
+                        self._log_debug(f"[ARC AI Builder] Scheduling error UI update task")
                     self.server.scheduler.run_task(self, show_error, delay=0)
             
-            # 启动生成线程
-            thread = threading.Thread(target=generate_in_thread, daemon=True)
-            thread.start()
+            # 在OpenAI管理器的事件循环中异步调用OpenAI API，不占用额外线程
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Generate - Calling OpenAI with size: {size}, requirements: '{requirements}'")
+            future = self.openai_manager.submit_building_commands(center_pos, size, requirements, player.name)
+            future.add_done_callback(on_generated)
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Start building generation error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Start building generation error: {str(e)}")
             player.send_message("开始生成建筑指令时出错，请重试。")
     
     def _show_build_confirm_panel(self, player, commands, estimated_cost, record=None, request_id=None):
@@ -830,21 +894,24 @@ class ARCAIBuilderPlugin(Plugin):
             # 获取玩家金钱
             player_money = self._get_player_money(player.name)
             
-            # 构建确认内容
-            content = f"建筑方案确认\n\n"
-            content += f"预估成本: {estimated_cost:,} 元\n"
-            content += f"你的余额: {player_money:,} 元\n"
-            content += f"指令数量: {len(commands)} 条\n\n"
-            
-            if player_money < estimated_cost:
-                content += "余额不足！无法建造此建筑。"
+            # 构建确认内容，各部分收集后一次拼接
+            can_afford = player_money >= estimated_cost
+            command_count = len(commands)
+            parts = [
+                "建筑方案确认\n\n",
+                f"预估成本: {estimated_cost:,} 元\n",
+                f"你的余额: {player_money:,} 元\n",
+                f"指令数量: {command_count} 条\n\n"
+            ]
+            
+            if not can_afford:
+                parts.append("余额不足！无法建造此建筑。")
             else:
-                content += "余额充足，可以开始建造！\n\n"
-                content += "建筑指令预览（前5条）：\n"
-                for i, cmd in enumerate(commands[:5]):
-                    content += f"{i+1}. {cmd}\n"
-                if len(commands) > 5:
-                    content += f"... 还有 {len(commands)-5} 条指令"
+                parts.append("余额充足，可以开始建造！\n\n建筑指令预览（前5条）：\n")
+                parts.extend(f"{i}. {cmd}\n" for i, cmd in enumerate(commands[:5], 1))
+                if command_count > 5:
+                    parts.append(f"... 还有 {command_count - 5} 条指令")
+            content = "".join(parts)
             
             # 创建确认面板
             confirm_panel = ActionForm(
@@ -853,7 +920,7 @@ class ARCAIBuilderPlugin(Plugin):
             )
             
             # 如果余额充足，添加确认按钮
-            if player_money >= estimated_cost:
+            if can_afford:
                 if record:
                     # 从记录确认的情况
                     confirm_panel.add_button(
@@ -882,186 +949,159 @@ class ARCAIBuilderPlugin(Plugin):
             player.send_form(confirm_panel)
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Show build confirm panel error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Show build confirm panel error: {str(e)}")
             player.send_message("显示确认面板时出错，请重试。")
     
     def _confirm_building(self, player, commands=None, estimated_cost=None, building_record=None, request_id=None):
         """确认建造"""
         try:
-            # 如果提供了参数，说明是从AI生成后确认建造
+            # 如果提供了参数，说明是从AI生成后确认建造，使用请求时记录的位置
             if commands is not None and estimated_cost is not None:
-                # 检查余额
-                player_money = self._get_player_money(player.name)
-                if player_money < estimated_cost:
-                    player.send_message("余额不足，无法建造！")
-                    return
-                
-                # 扣费
-                if not self._deduct_money(player.name, estimated_cost):
-                    player.send_message("扣费失败，无法建造！")
-                    return
-                
-                # 获取建筑位置
-                if request_id and request_id in self.request_positions:
-                    # 使用请求时记录的位置
-                    request_data = self.request_positions[request_id]
-                    center_pos = request_data['center_pos']
-                    dimension = request_data['dimension']
-                    size = request_data['size']
-                    requirements = request_data['requirements']
-                    
-                    self._safe_log('info', f"[ARC AI Builder] Using recorded position for request {request_id}: {center_pos}")
-                    
-                    # 生成建筑ID
-                    building_id = self.next_building_id
-                    self.next_building_id += 1
-                    
-                    # 保存建筑记录到内存
-                    building_data = {
-                        'id': building_id,
-                        'player_name': player.name,
-                        'player_uuid': self._get_player_uuid(player.name),
-                        'center_x': center_pos[0],
-                        'center_y': center_pos[1],
-                        'center_z': center_pos[2],
-                        'dimension': dimension,
-                        'size': size,
-                        'requirements': requirements,
-                        'estimated_cost': estimated_cost,
-                        'actual_cost': estimated_cost,
-                        'commands': commands,
-                        'status': 'building',
-                        'created_time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        'completed_time': None
-                    }
-                    
-                    self.building_records[building_id] = building_data
-                    
-                    # 开始执行建筑指令
-                    self._execute_building_commands_direct(player, commands, building_id, center_pos)
-                    
-                    # 清理请求记录
-                    del self.request_positions[request_id]
-                    
-                    # 显示开始建造消息
-                    player.send_message(f"建造已开始！预计成本：{estimated_cost:,} 元")
-                    player.send_message(f"建筑位置：({center_pos[0]}, {center_pos[1]}, {center_pos[2]})")
+                request_data = self.request_positions.get(request_id) if request_id else None
+                if request_data is None:
+                    player.send_message("建筑请求已过期，请重新开始。")
                     return
-                else:
-                    player.send_message("建筑位置信息丢失，无法建造！")
+                request = BuildRequest(
+                    center_pos=request_data.center_pos,
+                    dimension=request_data.dimension,
+                    size=request_data.size,
+                    requirements=request_data.requirements,
+                    player_name=player.name,
+                    commands=commands,
+                    estimated_cost=estimated_cost
+                )
+            else:
+                # 从缓存中获取请求的情况
+                request = self.player_requests.get(player.name)
+                if request is None:
+                    player.send_message("建筑请求已过期，请重新开始。")
                     return
             
-            # 从缓存中获取请求的情况
-            if player.name not in self.player_requests:
-                player.send_message("建筑请求已过期，请重新开始。")
-                return
-            
-            request = self.player_requests[player.name]
-            estimated_cost = request['estimated_cost']
-            
-            # 检查余额
-            player_money = self._get_player_money(player.name)
-            if player_money < estimated_cost:
-                player.send_message("余额不足，无法建造！")
-                return
-            
-            # 扣费
-            if not self._deduct_money(player.name, estimated_cost):
-                player.send_message("扣费失败，无法建造！")
-                return
-            
-            # 保存建筑记录
-            building_id = self._save_building_record(player, request)
-            if not building_id:
-                # 扣费失败，退款
-                self._add_money(player.name, estimated_cost)
-                player.send_message("保存建筑记录失败，已退款。")
+            if not self._perform_confirm(player, request):
                 return
             
-            # 开始执行建筑指令
-            self._execute_building_commands(player, request['commands'], building_id)
-            
-            # 清除缓存
-            del self.player_requests[player.name]
+            # 清理请求记录
+            if request_id:
+                self.request_positions.pop(request_id)
+            self.player_requests.pop(player.name)
             
             # 显示开始建造消息
-            player.send_message(f"建造已开始！预计成本：{estimated_cost:,} 元")
+            center_pos = request.center_pos
+            player.send_message(f"建造已开始！预计成本：{request.estimated_cost:,} 元\n建筑位置：({center_pos[0]}, {center_pos[1]}, {center_pos[2]})")
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Confirm building error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Confirm building error: {str(e)}")
             player.send_message("确认建造时出错，请重试。")
     
+    def _perform_confirm(self, player, request: BuildRequest) -> bool:
+        """
+        扣费、保存建筑记录并开始执行建筑指令，保存失败或未能开始建造时退款
+        :param player: 玩家
+        :param request: 建筑请求
+        :return: 是否已开始建造
+        """
+        estimated_cost = request.estimated_cost
+        
+        # 检查余额
+        player_money = self._get_player_money(player.name)
+        if player_money < estimated_cost:
+            player.send_message("余额不足，无法建造！")
+            return False
+        
+        # 扣费
+        if not self._deduct_money(player.name, estimated_cost):
+            player.send_message("扣费失败，无法建造！")
+            return False
+        
+        # 保存建筑记录
+        building_id = self._save_building_record(player, request)
+        if not building_id:
+            # 保存失败，退款
+            self._add_money(player.name, estimated_cost)
+            player.send_message("保存建筑记录失败，已退款。")
+            return False
+        
+        # 开始执行建筑指令
+        if not self._execute_building_commands(player, request.commands, building_id):
+            # 未能开始建造，记录已标记为失败，退款
+            self._add_money(player.name, estimated_cost)
+            player.send_message("建筑未能开始，已退款。")
+            return False
+        return True
+    
     # 经济系统相关方法
     def _get_player_money(self, player_name: str) -> int:
         """获取玩家金钱"""
         try:
             if not self.economy_plugin:
-                self._safe_log('warning', f"[ARC AI Builder] Get player money - No economy plugin available for {player_name}")
+                self._log_warning(f"[ARC AI Builder] Get player money - No economy plugin available for {player_name}")
                 return 0
             
             # 使用经济系统API获取玩家金钱
             money = self.economy_plugin.api_get_player_money(player_name)
-            self._safe_log('info', f"[ARC AI Builder] Get player money - {player_name}: {money} (type: {type(money)})")
+            if self.logger.is_enabled_for(Logger.Level.DEBUG):
+                self._log_debug(f"[ARC AI Builder] Get player money - {player_name}: {money} (type: {type(money)})")
             
             # 确保返回的是整数
             if money is None:
-                self._safe_log('warning', f"[ARC AI Builder] Get player money - {player_name} returned None, using 0")
+                self._log_warning(f"[ARC AI Builder] Get player money - {player_name} returned None, using 0")
                 return 0
             
             try:
-                return int(money)
+                money = int(money)
             except (ValueError, TypeError) as e:
-                self._safe_log('error', f"[ARC AI Builder] Get player money - Cannot convert {money} to int: {str(e)}")
+                self._log_error(f"[ARC AI Builder] Get player money - Cannot convert {money} to int: {str(e)}")
                 return 0
+            
+            return money
                 
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Get player money error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Get player money traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Get player money error: {str(e)}")
+            self._log_traceback("Get player money", e)
             return 0
     
     def _deduct_money(self, player_name: str, amount: int) -> bool:
         """扣除玩家金钱"""
         try:
             if not self.economy_plugin:
-                self._safe_log('warning', f"[ARC AI Builder] Deduct money - No economy plugin available for {player_name}")
+                self._log_warning(f"[ARC AI Builder] Deduct money - No economy plugin available for {player_name}")
                 return False
             
             if amount is None or amount <= 0:
-                self._safe_log('error', f"[ARC AI Builder] Deduct money - Invalid amount: {amount}")
+                self._log_error(f"[ARC AI Builder] Deduct money - Invalid amount: {amount}")
                 return False
             
-            self._safe_log('info', f"[ARC AI Builder] Deduct money - {player_name}: {amount}")
+            if self.logger.is_enabled_for(Logger.Level.DEBUG):
+                self._log_debug(f"[ARC AI Builder] Deduct money - {player_name}: {amount}")
             
             # 使用经济系统API扣除金钱
             self.economy_plugin.api_change_player_money(player_name, -amount)
             return True
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Deduct money error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Deduct money traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Deduct money error: {str(e)}")
+            self._log_traceback("Deduct money", e)
             return False
     
     def _add_money(self, player_name: str, amount: int) -> bool:
         """增加玩家金钱"""
         try:
             if not self.economy_plugin:
-                self._safe_log('warning', f"[ARC AI Builder] Add money - No economy plugin available for {player_name}")
+                self._log_warning(f"[ARC AI Builder] Add money - No economy plugin available for {player_name}")
                 return False
             
             if amount is None or amount <= 0:
-                self._safe_log('error', f"[ARC AI Builder] Add money - Invalid amount: {amount}")
+                self._log_error(f"[ARC AI Builder] Add money - Invalid amount: {amount}")
                 return False
             
-            self._safe_log('info', f"[ARC AI Builder] Add money - {player_name}: {amount}")
+            if self.logger.is_enabled_for(Logger.Level.DEBUG):
+                self._log_debug(f"[ARC AI Builder] Add money - {player_name}: {amount}")
             
             # 使用经济系统API增加金钱
             self.economy_plugin.api_change_player_money(player_name, amount)
             return True
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Add money error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Add money traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Add money error: {str(e)}")
+            self._log_traceback("Add money", e)
             return False
     
     # 建筑记录相关方法
@@ -1069,330 +1109,357 @@ class ARCAIBuilderPlugin(Plugin):
         """保存建筑记录"""
         try:
             # 添加详细的调试信息
-            self._safe_log('info', f"[ARC AI Builder] Save building record - player: {player.name}")
-            self._safe_log('info', f"[ARC AI Builder] Save building record - request: {request}")
+            debug = self.logger.is_enabled_for(Logger.Level.DEBUG)
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Save building record - player: {player.name}")
+                self._log_debug(f"[ARC AI Builder] Save building record - request: {request}")
             
             # 验证request参数
-            if not isinstance(request, dict):
-                self._safe_log('error', f"[ARC AI Builder] Save building record - request is not dict: {type(request)}")
+            if not isinstance(request, BuildRequest):
+                self._log_error(f"[ARC AI Builder] Save building record - request is not BuildRequest: {type(request)}")
                 return None
             
-            required_keys = ['center_pos', 'dimension', 'size', 'requirements', 'estimated_cost', 'commands']
-            for key in required_keys:
-                if key not in request:
-                    self._safe_log('error', f"[ARC AI Builder] Save building record - missing key: {key}")
-                    return None
-                if request[key] is None:
-                    self._safe_log('error', f"[ARC AI Builder] Save building record - {key} is None")
+            required_fields = ('center_pos', 'dimension', 'size', 'requirements', 'estimated_cost', 'commands')
+            for name in required_fields:
+                if getattr(request, name) is None:
+                    self._log_error(f"[ARC AI Builder] Save building record - {name} is None")
                     return None
             
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            current_time = time.strftime("%Y-%m-%d %H:%M:%S")
             
             # 获取玩家UUID
-            player_uuid = self._get_player_uuid(player.name)
-            self._safe_log('info', f"[ARC AI Builder] Save building record - player_uuid: {player_uuid}")
+            player_uuid = self._get_player_uuid(player.name, online_player=player)
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Save building record - player_uuid: {player_uuid}")
             
             # 验证center_pos
-            center_pos = request['center_pos']
+            center_pos = request.center_pos
             if not isinstance(center_pos, (list, tuple)) or len(center_pos) < 3:
-                self._safe_log('error', f"[ARC AI Builder] Save building record - invalid center_pos: {center_pos}")
+                self._log_error(f"[ARC AI Builder] Save building record - invalid center_pos: {center_pos}")
                 return None
             
             # 验证数值类型
             try:
-                center_x = float(center_pos[0])
-                center_y = float(center_pos[1])
-                center_z = float(center_pos[2])
-                size = int(request['size'])
-                estimated_cost = int(request['estimated_cost'])
+                # 坐标在保存时统一取整，之后使用时无需再次取整
+                center_x = math.floor(center_pos[0])
+                center_y = math.floor(center_pos[1])
+                center_z = math.floor(center_pos[2])
+                size = int(request.size)
+                estimated_cost = int(request.estimated_cost)
             except (ValueError, TypeError) as e:
-                self._safe_log('error', f"[ARC AI Builder] Save building record - type conversion error: {str(e)}")
+                self._log_error(f"[ARC AI Builder] Save building record - type conversion error: {str(e)}")
                 return None
             
             # 生成新的建筑ID
             building_id = self.next_building_id
             self.next_building_id += 1
             
-            building_data = {
-                'id': building_id,
-                'player_name': player.name,
-                'player_uuid': player_uuid,
-                'center_x': center_x,
-                'center_y': center_y,
-                'center_z': center_z,
-                'dimension': str(request['dimension']),
-                'size': size,
-                'requirements': str(request['requirements']),
-                'estimated_cost': estimated_cost,
-                'actual_cost': estimated_cost,  # 初始时等于预估成本
-                'commands': request['commands'],  # 直接存储列表，不需要JSON序列化
-                'status': 'building',
-                'created_time': current_time,
-                'completed_time': None
-            }
-            
-            self._safe_log('info', f"[ARC AI Builder] Save building record - building_data: {building_data}")
+            building_data = BuildingRecord(
+                id=building_id,
+                player_name=player.name,
+                player_uuid=player_uuid,
+                center_x=center_x,
+                center_y=center_y,
+                center_z=center_z,
+                dimension=str(request.dimension),
+                size=size,
+                requirements=str(request.requirements),
+                estimated_cost=estimated_cost,
+                actual_cost=estimated_cost,  # 初始时等于预估成本
+                commands=request.commands,  # 直接存储列表，不需要JSON序列化
+                status=BuildStatus.BUILDING,
+                created_time=current_time
+            )
+            
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Save building record - building_data: {building_data}")
             
             # 保存到内存
             self.building_records[building_id] = building_data
-            self._safe_log('info', f"[ARC AI Builder] Save building record - Memory insert successful")
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Save building record - Memory insert successful")
             
             # 缓存坐标信息到内存
             self.building_coordinates[building_id] = (center_x, center_y, center_z)
-            self._safe_log('info', f"[ARC AI Builder] Cached coordinates for building {building_id}: ({center_x}, {center_y}, {center_z})")
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Cached coordinates for building {building_id}: ({center_x}, {center_y}, {center_z})")
             
             return building_id
                 
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Save building record error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Save building record traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Save building record error: {str(e)}")
+            self._log_traceback("Save building record", e)
             return None
     
-    def _execute_building_commands_with_record(self, player, commands, building_id, building_record):
-        """使用建筑记录执行建筑指令"""
-        try:
-            # 添加详细的调试信息
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands with record - player: {player.name}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands with record - commands count: {len(commands) if commands else 0}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands with record - building_id: {building_id}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands with record - building_record: {building_record}")
-            
-            # 验证参数
-            if commands is None:
-                self._safe_log('error', "[ARC AI Builder] Execute building commands with record - commands is None")
-                player.send_message("建筑指令为空，无法执行！")
-                self._update_building_status(building_id, 'failed')
-                return
-            
-            if not isinstance(commands, list):
-                self._safe_log('error', f"[ARC AI Builder] Execute building commands with record - commands is not list: {type(commands)}")
-                player.send_message("建筑指令格式错误，无法执行！")
-                self._update_building_status(building_id, 'failed')
-                return
-            
-            if building_id is None:
-                self._safe_log('error', "[ARC AI Builder] Execute building commands with record - building_id is None")
-                player.send_message("建筑记录ID错误，无法执行！")
-                return
-            
-            # 获取建筑位置（从传入的记录或内存中获取）
-            center_pos = None
-            
-            if building_record and 'center_x' in building_record and 'center_y' in building_record and 'center_z' in building_record:
-                # 从传入的建筑记录中获取位置信息
-                import math
-                center_pos = (math.floor(building_record['center_x']), math.floor(building_record['center_y']), math.floor(building_record['center_z']))
-                self._safe_log('info', f"[ARC AI Builder] Execute building commands with record - using record position: {center_pos}")
-            elif building_id in self.building_records:
-                # 从内存中获取建筑记录
-                building_record = self.building_records[building_id]
-                if 'center_x' in building_record and 'center_y' in building_record and 'center_z' in building_record:
-                    import math
-                    center_pos = (math.floor(building_record['center_x']), math.floor(building_record['center_y']), math.floor(building_record['center_z']))
-                    self._safe_log('info', f"[ARC AI Builder] Execute building commands with record - using memory position: {center_pos}")
-                else:
-                    self._safe_log('error', f"[ARC AI Builder] Execute building commands with record - building record missing coordinates")
-                    player.send_message("建筑位置信息缺失，无法执行建筑指令！")
-                    return
-            else:
-                self._safe_log('error', f"[ARC AI Builder] Execute building commands with record - no building position found")
-                player.send_message("建筑位置信息缺失，无法执行建筑指令！")
-                return
-            
-            # 使用命令执行器异步执行指令
-            self.command_executor.execute_commands_async(commands, player.name, center_pos)
-            
-            # 更新建筑状态为建造中
-            self._update_building_status(building_id, 'building')
-            
-            # 显示进度提示
-            player.send_message("建筑指令已开始执行，请耐心等待...")
-            
-        except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Execute building commands with record error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Execute building commands with record traceback: {traceback.format_exc()}")
-            player.send_message("执行建筑指令时出错，请重试。")
-
-    def _execute_building_commands(self, player, commands, building_id):
-        """执行建筑指令"""
+    def _execute_building_commands(self, player, commands, building_id) -> bool:
+        """
+        执行建筑指令
+        :return: 是否已开始建造，未能开始时建筑记录会被标记为失败
+        """
         try:
             # 添加详细的调试信息
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands - player: {player.name}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands - commands count: {len(commands) if commands else 0}")
-            self._safe_log('info', f"[ARC AI Builder] Execute building commands - building_id: {building_id}")
+            debug = self.logger.is_enabled_for(Logger.Level.DEBUG)
+            if debug:
+                self._log_debug(f"[ARC AI Builder] Execute building commands - player: {player.name}")
+                self._log_debug(f"[ARC AI Builder] Execute building commands - commands count: {len(commands) if commands else 0}")
+                self._log_debug(f"[ARC AI Builder] Execute building commands - building_id: {building_id}")
             
             # 验证参数
             if commands is None:
-                self._safe_log('error', "[ARC AI Builder] Execute building commands - commands is None")
+                self._log_error("[ARC AI Builder] Execute building commands - commands is None")
                 player.send_message("建筑指令为空，无法执行！")
-                self._update_building_status(building_id, 'failed')
-                return
+                self._update_building_status(building_id, BuildStatus.FAILED)
+                return False
             
-            if not isinstance(commands, list):
-                self._safe_log('error', f"[ARC AI Builder] Execute building commands - commands is not list: {type(commands)}")
+            if type(commands) is not list:
+                self._log_error(f"[ARC AI Builder] Execute building commands - commands is not list: {type(commands)}")
                 player.send_message("建筑指令格式错误，无法执行！")
-                self._update_building_status(building_id, 'failed')
-                return
+                self._update_building_status(building_id, BuildStatus.FAILED)
+                return False
             
             if building_id is None:
-                self._safe_log('error', "[ARC AI Builder] Execute building commands - building_id is None")
+                self._log_error("[ARC AI Builder] Execute building commands - building_id is None")
                 player.send_message("建筑记录ID错误，无法执行！")
-                return
-            
-            # 获取建筑位置（优先从内存缓存获取）
-            center_pos = None
+                return False
             
-            # 从内存中获取建筑记录和坐标
-            if building_id in self.building_records:
-                building_record = self.building_records[building_id]
-                if 'center_x' in building_record and 'center_y' in building_record and 'center_z' in building_record:
-                    import math
-                    center_pos = (math.floor(building_record['center_x']), math.floor(building_record['center_y']), math.floor(building_record['center_z']))
-                    self._safe_log('info', f"[ARC AI Builder] Execute building commands - using memory position: {center_pos}")
-                else:
-                    self._safe_log('error', f"[ARC AI Builder] Execute building commands - building record missing coordinates")
-                    player.send_message("建筑位置信息缺失，无法执行建筑指令！")
-                    return
-            else:
-                self._safe_log('error', f"[ARC AI Builder] Execute building commands - building record not found in memory")
+            # 获取建筑位置
+            center_pos = self._resolve_center_pos(building_id)
+            if center_pos is None:
+                self._log_error(f"[ARC AI Builder] Execute building commands - building record not found in memory")
                 player.send_message("建筑记录不存在，无法执行建筑指令！")
-                return
+                return False
             
             # 使用命令执行器异步执行指令
-            self.command_executor.execute_commands_async(commands, player.name, center_pos)
+            if not self.command_executor.execute_commands_async(commands, player.name, center_pos):
+                self._log_error(f"[ARC AI Builder] Execute building commands - command executor did not start for {player.name}")
+                player.send_message("建筑指令未能开始执行，请稍后重试！")
+                self._update_building_status(building_id, BuildStatus.FAILED)
+                return False
             
             # 更新建筑状态为建造中
-            self._update_building_status(building_id, 'building')
+            self._update_building_status(building_id, BuildStatus.BUILDING)
             
             # 显示进度提示
             player.send_message("建筑指令已开始执行，请耐心等待...")
+            return True
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Execute building commands error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Execute building commands traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Execute building commands error: {str(e)}")
+            self._log_traceback("Execute building commands", e)
             player.send_message("执行建筑指令时出错！")
             if building_id is not None:
-                self._update_building_status(building_id, 'failed')
+                self._update_building_status(building_id, BuildStatus.FAILED)
+            return False
     
-    def _update_building_status(self, building_id: int, status: str):
+    def _resolve_center_pos(self, building_id: int) -> Optional[Tuple[int, int, int]]:
+        """
+        获取建筑中心位置，优先使用坐标缓存，其次使用内存中的记录
+        :param building_id: 建筑ID
+        :return: 已取整的中心位置 (x, y, z)，找不到时返回None
+        """
+        center_pos = self.building_coordinates.get(building_id)
+        if center_pos is not None:
+            return center_pos
+        record = self.building_records.get(building_id)
+        if record is None:
+            return None
+        return record.center_x, record.center_y, record.center_z
+    
+    def _update_building_status(self, building_id: int, status: BuildStatus):
         """更新建筑状态"""
         try:
+            info = self.logger.is_enabled_for(Logger.Level.INFO)
             # 添加详细的调试信息
-            self._safe_log('info', f"[ARC AI Builder] Update building status - building_id: {building_id}, status: {status}")
+            if info:
+                self._log_info(f"[ARC AI Builder] Update building status - building_id: {building_id}, status: {status.name}")
             
             # 验证参数
             if building_id is None:
-                self._safe_log('error', "[ARC AI Builder] Update building status - building_id is None")
+                self._log_error("[ARC AI Builder] Update building status - building_id is None")
                 return
             
             if status is None:
-                self._safe_log('error', "[ARC AI Builder] Update building status - status is None")
+                self._log_error("[ARC AI Builder] Update building status - status is None")
                 return
             
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
             # 更新内存中的建筑记录
             if building_id in self.building_records:
-                self.building_records[building_id]['status'] = str(status)
-                if status in ['completed', 'failed']:
-                    self.building_records[building_id]['completed_time'] = current_time
+                record = self.building_records[building_id]
+                # 同步待确认索引
+                if record.status is BuildStatus.PENDING and status is not BuildStatus.PENDING:
+                    self._unindex_pending(record)
+                elif record.status is not BuildStatus.PENDING and status is BuildStatus.PENDING:
+                    bisect.insort(self._pending_by_player[record.player_name], building_id)
+                # 同步建造中索引
+                if status is BuildStatus.BUILDING:
+                    self._active_building_by_player[record.player_name] = building_id
+                elif self._active_building_by_player.get(record.player_name) == building_id:
+                    del self._active_building_by_player[record.player_name]
+                record.status = status
+                finished = status in _FINISHED_STATUSES
+                if finished:
+                    # 只有结束时才需要时间戳
+                    record.completed_time = time.strftime("%Y-%m-%d %H:%M:%S")
                 
-                self._safe_log('info', f"[ARC AI Builder] Update building status - Memory update successful for building {building_id}")
+                if info:
+                    self._log_info(f"[ARC AI Builder] Update building status - Memory update successful for building {building_id}")
                 
-                # 如果建筑完成或失败，清理坐标缓存和建筑记录
-                if status in ['completed', 'failed']:
+                # 如果建筑已结束，清理坐标缓存和建筑记录
+                if finished:
                     if building_id in self.building_coordinates:
                         del self.building_coordinates[building_id]
-                        self._safe_log('info', f"[ARC AI Builder] Cleared coordinate cache for building {building_id}")
+                        if info:
+                            self._log_info(f"[ARC AI Builder] Cleared coordinate cache for building {building_id}")
                     # 可以选择保留建筑记录用于历史查看，或者删除
                     # del self.building_records[building_id]
             else:
-                self._safe_log('error', f"[ARC AI Builder] Update building status - Building record not found in memory: {building_id}")
+                self._log_error(f"[ARC AI Builder] Update building status - Building record not found in memory: {building_id}")
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Update building status error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Update building status traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Update building status error: {str(e)}")
+            self._log_traceback("Update building status", e)
+    
+    def _unindex_pending(self, record):
+        """将记录从待确认索引中移除"""
+        if record.status is not BuildStatus.PENDING:
+            return
+        pending_ids = self._pending_by_player.get(record.player_name)
+        if pending_ids:
+            index = bisect.bisect_left(pending_ids, record.id)
+            if index < len(pending_ids) and pending_ids[index] == record.id:
+                del pending_ids[index]
+            if not pending_ids:
+                del self._pending_by_player[record.player_name]
     
     # 回调方法
     def _on_build_progress(self, player_name: str, current: int, total: int):
-        """建筑进度回调"""
+        """
+        建筑进度回调：只记录最新进度，由 _flush_build_progress 每秒统一通知玩家
+        :param player_name: 玩家名称
+        :param current: 已执行的命令数，由 CommandExecutor 保证为整数
+        :param total: 总命令数，由 CommandExecutor 保证为整数
+        """
+        self._pending_progress[player_name] = (current, total)
+    
+    def _flush_build_progress(self):
+        """定时任务（每秒一次）：为每个玩家发送一条最新的建筑进度"""
+        if not self._pending_progress:
+            return
+        pending = self._pending_progress
+        self._pending_progress = {}
+        info = self.logger.is_enabled_for(Logger.Level.INFO)
+        
+        for player_name, (current, total) in pending.items():
+            try:
+                # 整数计算进度百分比，百分比未变化时不重复通知
+                progress_percent = current * 100 // total if total else 0
+                if self._last_percent.get(player_name) == progress_percent:
+                    continue
+                self._last_percent[player_name] = progress_percent
+                
+                if info:
+                    self._log_info(f"[ARC AI Builder] Building progress for {player_name}: {current}/{total} ({progress_percent}%)")
+                
+                # 通知玩家
+                online_player = self.server.get_player(player_name)
+                if online_player:
+                    online_player.send_message(f"建筑进度: {current}/{total} ({progress_percent}%)")
+                    
+            except Exception as e:
+                self._log_error(f"[ARC AI Builder] Build progress callback error: {str(e)}")
+                self._log_traceback("Build progress callback", e)
+    
+    def _on_build_complete(self, player_name: str, completed: int, total: int):
+        """
+        建筑完成回调
+        :param player_name: 玩家名称
+        :param completed: 已执行的命令数，由 CommandExecutor 保证为整数
+        :param total: 总命令数，由 CommandExecutor 保证为整数
+        """
         try:
-            # 添加详细的调试信息
-            self._safe_log('info', f"[ARC AI Builder] Build progress - player_name: {player_name}, current: {current}, total: {total}")
+            info = self.logger.is_enabled_for(Logger.Level.INFO)
+            if info:
+                self._log_info(f"[ARC AI Builder] Building completed for {player_name}: {completed}/{total}")
             
-            # 验证参数
-            if current is None or total is None:
-                self._safe_log('error', f"[ARC AI Builder] Build progress - current or total is None: current={current}, total={total}")
-                return
+            # 已完成的建筑不再发送尚未通知的进度
+            self._pending_progress.pop(player_name, None)
+            self._last_percent.pop(player_name, None)
             
-            # 安全地计算进度百分比
-            try:
-                progress_percent = int((current / total) * 100) if total > 0 else 0
-            except (ZeroDivisionError, TypeError) as e:
-                self._safe_log('error', f"[ARC AI Builder] Build progress - Error calculating progress: {str(e)}")
-                progress_percent = 0
+            # 从建造中索引查找该玩家的建筑记录
+            building_id = self._active_building_by_player.get(player_name)
+            if building_id is not None:
+                record = self.building_records.get(building_id)
+                if record is None or record.status is not BuildStatus.BUILDING or record.player_name != player_name:
+                    # 索引已失效
+                    del self._active_building_by_player[player_name]
+                    building_id = None
             
-            self._safe_log('info', f"[ARC AI Builder] Building progress for {player_name}: {current}/{total} ({progress_percent}%)")
+            if building_id:
+                if info:
+                    self._log_info(f"[ARC AI Builder] Build complete - Found building record: {building_id}")
+                self._update_building_status(building_id, BuildStatus.COMPLETED)
+            else:
+                self._log_warning(f"[ARC AI Builder] Build complete - No building record found for {player_name}")
             
-            # 可以在这里添加进度通知给玩家
+            # 通知玩家
             online_player = self.server.get_player(player_name)
             if online_player:
-                online_player.send_message(f"建筑进度: {current}/{total} ({progress_percent}%)")
+                online_player.send_message("建筑建造完成！")
+            else:
+                self._log_warning(f"[ARC AI Builder] Build complete - Player {player_name} is not online")
                 
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Build progress callback error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Build progress callback traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Build complete callback error: {str(e)}")
+            self._log_traceback("Build complete callback", e)
     
-    def _on_build_complete(self, player_name: str, completed: int, total: int):
-        """建筑完成回调"""
+    def _on_build_cancelled(self, player_name: str, completed: int, total: int):
+        """
+        建筑取消回调：执行中的建筑被停止（如插件停用）时调用
+        :param player_name: 玩家名称
+        :param completed: 已执行的命令数，由 CommandExecutor 保证为整数
+        :param total: 总命令数，由 CommandExecutor 保证为整数
+        """
         try:
-            # 添加详细的调试信息
-            self._safe_log('info', f"[ARC AI Builder] Build complete - player_name: {player_name}, completed: {completed}, total: {total}")
+            if self.logger.is_enabled_for(Logger.Level.INFO):
+                self._log_info(f"[ARC AI Builder] Building cancelled for {player_name}: {completed}/{total}")
             
-            # 验证参数
-            if completed is None or total is None:
-                self._safe_log('error', f"[ARC AI Builder] Build complete - completed or total is None: completed={completed}, total={total}")
-                return
+            # 已取消的建筑不再发送尚未通知的进度
+            self._pending_progress.pop(player_name, None)
+            self._last_percent.pop(player_name, None)
             
-            self._safe_log('info', f"[ARC AI Builder] Building completed for {player_name}: {completed}/{total}")
-            
-            # 从内存中查找该玩家的建筑记录
-            building_id = None
-            for bid, record in self.building_records.items():
-                if record['player_name'] == player_name and record['status'] == 'building':
-                    building_id = bid
-                    break
-            
-            if building_id:
-                self._safe_log('info', f"[ARC AI Builder] Build complete - Found building record: {building_id}")
-                self._update_building_status(building_id, 'completed')
-            else:
-                self._safe_log('warning', f"[ARC AI Builder] Build complete - No building record found for {player_name}")
+            # 从建造中索引查找该玩家的建筑记录
+            building_id = self._active_building_by_player.get(player_name)
+            if building_id is not None:
+                record = self.building_records.get(building_id)
+                if record is not None and record.status is BuildStatus.BUILDING:
+                    self._update_building_status(building_id, BuildStatus.CANCELLED)
+                else:
+                    # 索引已失效
+                    del self._active_building_by_player[player_name]
             
             # 通知玩家
             online_player = self.server.get_player(player_name)
             if online_player:
-                online_player.send_message("建筑建造完成！")
-            else:
-                self._safe_log('warning', f"[ARC AI Builder] Build complete - Player {player_name} is not online")
+                online_player.send_message(f"建筑建造已中断：已执行 {completed}/{total} 条指令。")
                 
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Build complete callback error: {str(e)}")
-            import traceback
-            self._safe_log('error', f"[ARC AI Builder] Build complete callback traceback: {traceback.format_exc()}")
+            self._log_error(f"[ARC AI Builder] Build cancel callback error: {str(e)}")
+            self._log_traceback("Build cancel callback", e)
     
     # 历史记录相关方法
     # 辅助方法
-    def _get_player_uuid(self, player_name: str) -> str:
-        """获取玩家UUID"""
+    def _get_player_uuid(self, player_name: str, online_player=None) -> str:
+        """
+        获取玩家UUID
+        :param player_name: 玩家名称
+        :param online_player: 调用方已持有的在线玩家对象，提供时无需再次查找
+        :return: 玩家UUID，玩家不在线时返回临时UUID
+        """
         try:
+            if online_player is None:
+                online_player = self.server.get_player(player_name)
+            
             # 如果玩家在线，直接获取UUID
-            online_player = self.server.get_player(player_name)
             if online_player is not None:
                 return str(online_player.unique_id)
             
@@ -1400,5 +1467,5 @@ class ARCAIBuilderPlugin(Plugin):
             return f"offline_{player_name}"
             
         except Exception as e:
-            self._safe_log('error', f"[ARC AI Builder] Get player UUID error: {str(e)}")
+            self._log_error(f"[ARC AI Builder] Get player UUID error: {str(e)}")
             return f"offline_{player_name}"
@@ -0,0 +1,163 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# 直接从 src 目录导入插件包，无需先安装
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+
+class FakeTask:
+    def __init__(self, callback, delay, period):
+        self.callback = callback
+        self.delay = delay
+        self.period = period
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeScheduler:
+    """按调用 tick() 的次数推进服务器tick，只运行到期的任务"""
+
+    def __init__(self):
+        self.tasks = []
+        self.current_tick = 0
+
+    def run_task(self, plugin, callback, delay=0, period=0):
+        task = FakeTask(callback, delay, period)
+        task.next_tick = self.current_tick + delay
+        self.tasks.append(task)
+        return task
+
+    def tick(self, count=1):
+        for _ in range(count):
+            for task in list(self.tasks):
+                if task.cancelled or task.next_tick > self.current_tick:
+                    continue
+                task.callback()
+                if task.period:
+                    task.next_tick = self.current_tick + task.period
+                else:
+                    task.cancelled = True
+            self.tasks = [task for task in self.tasks if not task.cancelled]
+            self.current_tick += 1
+
+
+class FakePlayer:
+    def __init__(self, name):
+        self.name = name
+        self.unique_id = f"uuid-{name}"
+        self.messages = []
+        self.forms = []
+
+    def send_message(self, message):
+        self.messages.append(message)
+
+    def send_form(self, form):
+        self.forms.append(form)
+
+
+class FakeEconomy:
+    def __init__(self):
+        self.balances = {}
+
+    def api_get_player_money(self, player_name):
+        return self.balances.get(player_name, 0)
+
+    def api_change_player_money(self, player_name, amount):
+        self.balances[player_name] = self.balances.get(player_name, 0) + amount
+
+
+class FakePluginManager:
+    def __init__(self):
+        self.plugins = {}
+
+    def get_plugin(self, name):
+        return self.plugins.get(name)
+
+
+class FakeServer:
+    def __init__(self):
+        self.scheduler = FakeScheduler()
+        self.plugin_manager = FakePluginManager()
+        self.command_sender = object()
+        self.players = {}
+        self.dispatched = []
+
+    def add_player(self, name):
+        player = self.players[name] = FakePlayer(name)
+        return player
+
+    def get_player(self, name):
+        return self.players.get(name)
+
+    def dispatch_command(self, sender, command):
+        self.dispatched.append(command)
+        return True
+
+
+class FakeLogger:
+    """记录日志的日志器，级别取值与 endstone.Logger.Level 相同（INFO 为 2）"""
+
+    def __init__(self, level=2):
+        self.level = level
+        self.records = []
+
+    def set_level(self, level):
+        self.level = level
+
+    def is_enabled_for(self, level):
+        return level >= self.level
+
+    def _log(self, level_name, message):
+        self.records.append((level_name, message))
+
+    def trace(self, message):
+        self._log("trace", message)
+
+    def debug(self, message):
+        self._log("debug", message)
+
+    def info(self, message):
+        self._log("info", message)
+
+    def warning(self, message):
+        self._log("warning", message)
+
+    def error(self, message):
+        self._log("error", message)
+
+    def critical(self, message):
+        self._log("critical", message)
+
+
+class FakeSettings:
+    def __init__(self, **settings):
+        self.settings = settings
+
+    def GetSetting(self, key):
+        return self.settings.get(key) or None
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def economy(server):
+    # 以 arc_core 的名义提供经济接口
+    economy = server.plugin_manager.plugins["arc_core"] = FakeEconomy()
+    return economy
+
+
+@pytest.fixture
+def logger():
+    return FakeLogger()
+
+
+@pytest.fixture
+def make_settings():
+    return FakeSettings
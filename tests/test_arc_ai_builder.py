@@ -0,0 +1,288 @@
+import types
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("endstone")
+
+from endstone_arc_ai_builder import arc_ai_builder
+from endstone_arc_ai_builder.arc_ai_builder import ARCAIBuilderPlugin, BuildRequest, BuildStatus, _ExpiringDict
+
+
+class PluginUnderTest(ARCAIBuilderPlugin):
+    # 测试中直接注入服务器与日志器，替代由 Endstone 提供的属性
+    server = None
+    logger = None
+
+    def register_events(self, listener):
+        pass
+
+
+@pytest.fixture
+def plugin(server, economy, logger, tmp_path, monkeypatch):
+    # 配置目录是相对于服务器工作目录的 plugins/ARCAIBuilder
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "plugins").mkdir()
+    plugin = PluginUnderTest()
+    plugin.server = server
+    plugin.logger = logger
+    plugin.on_load()
+    plugin.on_enable()
+    plugin.land_manager = None
+    yield plugin
+    plugin.on_disable()
+
+
+def _request(player_name, commands=None, estimated_cost=100):
+    return BuildRequest(
+        center_pos=(10, 64, 10),
+        dimension="Overworld",
+        size=5,
+        requirements="小木屋",
+        player_name=player_name,
+        commands=commands if commands is not None else ["setblock ~ ~ ~ stone", "setblock ~ ~1 ~ glass"],
+        estimated_cost=estimated_cost
+    )
+
+
+def test_confirm_refunds_when_build_cannot_start(plugin, server, economy):
+    steve = server.add_player("steve")
+    alex = server.add_player("alex")
+    economy.balances.update(steve=1000, alex=1000)
+
+    assert plugin._perform_confirm(steve, _request("steve"))
+    # 执行器正忙，alex 的建造无法开始：退款并将记录标记为失败
+    assert not plugin._perform_confirm(alex, _request("alex"))
+
+    assert economy.balances == {"steve": 900, "alex": 1000}
+    statuses = {record.player_name: record.status for record in plugin.building_records.values()}
+    assert statuses == {"steve": BuildStatus.BUILDING, "alex": BuildStatus.FAILED}
+    assert alex.messages[-1] == "建筑未能开始，已退款。"
+
+
+def test_confirm_cached_request_charges_and_builds(plugin, server, economy):
+    steve = server.add_player("steve")
+    economy.balances["steve"] = 1000
+    plugin.player_requests["steve"] = _request("steve")
+
+    plugin._confirm_building(steve)
+
+    assert economy.balances["steve"] == 900
+    assert plugin.player_requests.get("steve") is None
+    assert steve.messages[-1].startswith("建造已开始！")
+    server.scheduler.tick(20)
+    assert server.dispatched == ["setblock 10 64 10 stone", "setblock 10 65 10 glass"]
+    (record,) = plugin.building_records.values()
+    assert record.status is BuildStatus.COMPLETED
+
+
+def test_confirm_generated_request_uses_recorded_position(plugin, server, economy):
+    steve = server.add_player("steve")
+    economy.balances["steve"] = 1000
+    plugin.request_positions[7] = _request("steve", commands=[])
+
+    plugin._confirm_building(steve, ["setblock ~ ~ ~ stone"], 50, request_id=7)
+
+    assert economy.balances["steve"] == 950
+    assert plugin.request_positions.get(7) is None
+    server.scheduler.tick()
+    assert server.dispatched == ["setblock 10 64 10 stone"]
+
+
+def test_confirm_with_insufficient_balance_keeps_request(plugin, server, economy):
+    steve = server.add_player("steve")
+    economy.balances["steve"] = 50
+    plugin.player_requests["steve"] = _request("steve")
+
+    plugin._confirm_building(steve)
+
+    assert economy.balances["steve"] == 50
+    assert plugin.player_requests.get("steve") is not None
+    assert not plugin.building_records
+    assert steve.messages[-1] == "余额不足，无法建造！"
+
+
+def test_confirm_refunds_when_record_cannot_be_saved(plugin, server, economy, monkeypatch):
+    steve = server.add_player("steve")
+    economy.balances["steve"] = 1000
+    monkeypatch.setattr(plugin, "_save_building_record", lambda player, request: None)
+
+    assert not plugin._perform_confirm(steve, _request("steve"))
+
+    assert economy.balances["steve"] == 1000
+    assert steve.messages[-1] == "保存建筑记录失败，已退款。"
+
+
+def test_confirm_pending_record_replaces_it(plugin, server, economy):
+    steve = server.add_player("steve")
+    economy.balances["steve"] = 1000
+    building_id = plugin._save_building_record(steve, _request("steve"))
+    plugin._update_building_status(building_id, BuildStatus.PENDING)
+    record = plugin.building_records[building_id]
+
+    plugin._confirm_building_with_record(steve, record.commands, record.estimated_cost, record)
+
+    assert economy.balances["steve"] == 900
+    assert building_id not in plugin.building_records
+    assert "steve" not in plugin._pending_by_player
+    (new_record,) = plugin.building_records.values()
+    assert new_record.status is BuildStatus.BUILDING
+
+
+def test_pending_index_tracks_status_changes(plugin, server):
+    steve = server.add_player("steve")
+    plugin._show_rebuild_panel(steve)
+    assert steve.messages[-1] == "❌ 没有找到待确认的建筑设计！"
+
+    building_ids = [plugin._save_building_record(steve, _request("steve")) for _ in range(12)]
+    for building_id in building_ids:
+        plugin._update_building_status(building_id, BuildStatus.PENDING)
+    plugin._update_building_status(building_ids[3], BuildStatus.BUILDING)
+    assert plugin._pending_by_player["steve"] == building_ids[:3] + building_ids[4:]
+
+    # 面板最多显示最新的 10 条待确认记录
+    plugin._show_rebuild_panel(steve)
+    assert steve.forms[-1].content.startswith("找到 10 条待确认的建筑设计")
+
+    for building_id in building_ids:
+        plugin._update_building_status(building_id, BuildStatus.FAILED)
+    assert "steve" not in plugin._pending_by_player
+
+
+def test_player_uuid(plugin, server):
+    steve = server.add_player("steve")
+    building_id = plugin._save_building_record(steve, _request("steve"))
+    assert plugin.building_records[building_id].player_uuid == "uuid-steve"
+    assert plugin._get_player_uuid("steve") == "uuid-steve"
+    assert plugin._get_player_uuid("ghost") == "offline_ghost"
+
+
+def test_confirm_reads_the_live_balance(plugin, server, economy):
+    steve = server.add_player("steve")
+    economy.balances["steve"] = 1000
+    request = plugin.player_requests["steve"] = _request("steve")
+    plugin._show_build_confirm_panel(steve, request.commands, request.estimated_cost)
+    assert steve.forms
+
+    # 面板显示之后余额被其他插件改变
+    economy.balances["steve"] = 50
+    plugin._confirm_building(steve)
+
+    assert economy.balances["steve"] == 50
+    assert steve.messages[-1] == "余额不足，无法建造！"
+
+
+class FailingOpenAI:
+    def submit_building_commands(self, center_pos, size, requirements, player_name):
+        future = Future()
+        future.set_exception(RuntimeError("boom"))
+        return future
+
+    def close(self):
+        pass
+
+
+def test_generation_error_is_reported_to_player(plugin, server):
+    steve = server.add_player("steve")
+    plugin.openai_manager = FailingOpenAI()
+
+    plugin._start_building_generation(steve, (10, 64, 10), "Overworld", 5, "小木屋")
+    server.scheduler.tick()
+
+    assert steve.messages[-1] == "生成建筑指令时发生错误：boom\n请重新尝试或联系管理员。"
+    assert not plugin.request_positions
+
+
+
+def test_build_progress_is_flushed_once_per_second(plugin, server):
+    steve = server.add_player("steve")
+    for current in range(1, 4):
+        plugin._on_build_progress("steve", current, 10)
+    assert steve.messages == []
+
+    # 进度任务每 20 tick 运行一次，只发送最新的进度
+    server.scheduler.tick(21)
+    assert steve.messages == ["建筑进度: 3/10 (30%)"]
+    server.scheduler.tick(20)
+    assert steve.messages == ["建筑进度: 3/10 (30%)"]
+
+
+def test_build_progress_skips_unchanged_percent(plugin, server):
+    steve = server.add_player("steve")
+    for current, total in [(1, 3), (1, 300), (2, 300), (3, 3), (0, 0)]:
+        plugin._on_build_progress("steve", current, total)
+        plugin._flush_build_progress()
+
+    # 百分比向下取整，与上次相同的百分比不会重复发送
+    assert steve.messages == [
+        "建筑进度: 1/3 (33%)",
+        "建筑进度: 1/300 (0%)",
+        "建筑进度: 3/3 (100%)",
+        "建筑进度: 0/0 (0%)",
+    ]
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(arc_ai_builder, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = _ExpiringDict(maxsize=10, ttl=5.0)
+    cache["a"] = 1
+    clock.now += 4.9
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert cache.get("a", "missing") == "missing"
+    assert len(cache) == 0
+
+
+def test_pop_ignores_expired_entries(clock):
+    cache = _ExpiringDict(maxsize=10, ttl=5.0)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.pop("a") == 1
+    clock.now += 5.0
+    assert cache.pop("b", "missing") == "missing"
+    assert len(cache) == 0
+
+
+def test_rewrite_refreshes_expiry(clock):
+    cache = _ExpiringDict(maxsize=10, ttl=5.0)
+    cache["a"] = 1
+    clock.now += 3.0
+    cache["a"] = 2
+    clock.now += 3.0
+    assert cache.get("a") == 2
+
+
+def test_writes_purge_expired_entries(clock):
+    cache = _ExpiringDict(maxsize=10, ttl=5.0)
+    cache["a"] = 1
+    cache["b"] = 2
+    clock.now += 5.0
+    cache["c"] = 3
+    assert len(cache) == 1
+    assert cache.get("c") == 3
+
+
+def test_size_cap_evicts_oldest_write(clock):
+    cache = _ExpiringDict(maxsize=3, ttl=60.0)
+    for key in "abc":
+        cache[key] = key
+    # 重新写入的条目移到末尾，不会最先被淘汰
+    cache["a"] = "a2"
+    cache["d"] = "d"
+    assert len(cache) == 3
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a2", "c", "d"]
+
+
+def test_clear(clock):
+    cache = _ExpiringDict(maxsize=3, ttl=60.0)
+    cache["a"] = 1
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get("a") is None
@@ -0,0 +1,159 @@
+import pytest
+
+pytest.importorskip("endstone")
+
+from endstone_arc_ai_builder.CommandExecutor import CommandExecutor
+
+
+@pytest.fixture
+def executor():
+    return CommandExecutor(server=None)
+
+
+@pytest.mark.parametrize("command, expected", [
+    ("setblock ~ ~ ~ oak_stairs[facing=north]", "setblock ~ ~ ~ oak_stairs"),
+    ("setblock ~ ~ ~ oak_slab[type=top,waterlogged=false]", "setblock ~ ~ ~ oak_slab"),
+    ("fill ~ ~ ~ ~1 ~1 ~1 wool 14", "fill ~ ~ ~ ~1 ~1 ~1 wool"),
+    ("setblock  ~ ~1   ~ stone ", "setblock ~ ~1 ~ stone"),
+    ("setblock ~ ~ ~ stone", "setblock ~ ~ ~ stone"),
+])
+def test_clean_block_states(executor, command, expected):
+    assert executor._clean_block_states(command) == expected
+
+
+CENTER = (100, 64, -20)
+
+
+@pytest.mark.parametrize("command, expected", [
+    ("setblock ~ ~ ~ stone", "setblock 100 64 -20 stone"),
+    ("setblock ~1 ~-2 ~+3 glass", "setblock 101 62 -17 glass"),
+    ("fill ~-1 ~ ~-1 ~1 ~4 ~1 oak_planks", "fill 99 64 -21 101 68 -19 oak_planks"),
+    ("FILL ~ ~ ~ ~ ~ ~ air", "FILL 100 64 -20 100 64 -20 air"),
+])
+def test_convert_relative_coords(executor, command, expected):
+    assert executor._convert_relative_coords(command, CENTER) == expected
+
+
+def test_absolute_coords_are_kept(executor):
+    assert executor._convert_relative_coords("fill 0 ~ 5 ~2 70 ~ stone", CENTER) == "fill 0 64 5 102 70 -20 stone"
+
+
+def test_only_coordinate_slots_are_converted(executor):
+    # 坐标参数之后的 ~ 不是坐标，保持不变
+    assert executor._convert_relative_coords("setblock ~ ~ ~ ~stone ~1", CENTER) == "setblock 100 64 -20 ~stone ~1"
+    assert executor._convert_relative_coords("fill ~ ~ ~ ~ ~ ~ stone replace ~", CENTER) == \
+        "fill 100 64 -20 100 64 -20 stone replace ~"
+
+
+def test_other_commands_are_unchanged(executor):
+    assert executor._convert_relative_coords("say ~ ~ ~", CENTER) == "say ~ ~ ~"
+
+
+def test_short_command_converts_available_slots(executor):
+    assert executor._convert_relative_coords("setblock ~ ~1", CENTER) == "setblock 100 65"
+
+
+def test_invalid_offset_returns_original(executor):
+    assert executor._convert_relative_coords("setblock ~a ~ ~ stone", CENTER) == "setblock ~a ~ ~ stone"
+
+
+@pytest.mark.parametrize("command, expected", [
+    ("setblock 10 64 10 stone", "setblock 10 64 10 stone"),
+    ("fill 0 64 0 ~5 ~5 ~5 oak_planks", "fill 0 64 0 105 69 -15 oak_planks"),
+    ("setblock 1 2 3 wool 14", "setblock 1 2 3 wool"),
+    ("setblock ~ ~1 ~ oak_stairs[facing=north] 0", "setblock 100 65 -20 oak_stairs"),
+    ("fill ~-2 ~ ~-2 ~2 ~ ~2 carpet 0 replace", "fill 98 64 -22 102 64 -18 carpet replace"),
+])
+def test_prepare_commands(executor, command, expected):
+    # 先清理方块状态和数据值，再转换坐标，绝对坐标保持不变
+    assert executor._prepare_commands([command], CENTER) == [expected]
+
+
+def _start(server, settings, commands, **callbacks):
+    executor = CommandExecutor(server=server, setting_manager=settings, **callbacks)
+    started = executor.execute_commands_async(commands, "steve", (0, 64, 0))
+    return executor, started
+
+
+@pytest.mark.parametrize("delay, batch_size, period, per_tick", [
+    ("0.1", "1", 2, 1),
+    ("0.5", "3", 10, 3),
+    ("0", "0", 1, 1),
+])
+def test_pacing_settings(server, make_settings, delay, batch_size, period, per_tick):
+    commands = [f"setblock ~{i} ~ ~ stone" for i in range(10)]
+    _, started = _start(server, make_settings(build_delay=delay, build_batch_size=batch_size), commands)
+    assert started
+    assert server.scheduler.tasks[0].period == period
+    server.scheduler.tick()
+    assert len(server.dispatched) == per_tick
+
+
+@pytest.mark.parametrize("delay, batch_size", [("0,25", "1"), ("0.1", "2.5"), ("fast", "many")])
+def test_invalid_pacing_settings_fall_back_to_defaults(server, make_settings, delay, batch_size):
+    _, started = _start(server, make_settings(build_delay=delay, build_batch_size=batch_size), ["setblock ~ ~ ~ stone"] * 3)
+    assert started
+    assert server.scheduler.tasks[0].period == 2
+    server.scheduler.tick()
+    assert len(server.dispatched) == 1
+
+
+def test_execute_reports_when_not_started(server, make_settings):
+    executor, started = _start(server, make_settings(), ["setblock ~ ~ ~ stone"])
+    assert started
+    # 已有任务在执行时不会开始新的任务
+    assert not executor.execute_commands_async(["setblock ~ ~ ~ glass"], "alex", (0, 64, 0))
+    assert not CommandExecutor(server=server).execute_commands_async(["setblock ~ ~ ~ stone"], "alex", None)
+
+
+def test_prepare_commands_checks_log_level_once(server, logger, monkeypatch):
+    executor = CommandExecutor(server=server, logger=logger)
+    calls = []
+    monkeypatch.setattr(logger, "is_enabled_for", lambda level: calls.append(level) or True)
+
+    executor._prepare_commands(["setblock ~ ~ ~ stone"] * 5, CENTER)
+
+    assert len(calls) == 1
+    # 开启 DEBUG 时每条命令仍记录转换前后的内容
+    assert sum(1 for _, message in logger.records if "转换后命令" in message) == 5
+
+
+def test_commands_are_paced_by_the_scheduler(server, make_settings):
+    completed = []
+    progress = []
+    commands = [f"setblock ~{i} ~ ~ stone" for i in range(3)]
+    executor, started = _start(server, make_settings(build_delay="0.1"), commands,
+                               on_progress=lambda *args: progress.append(args),
+                               on_complete=lambda *args: completed.append(args))
+    assert started
+    # 开始执行时不会同步派发任何命令
+    assert server.dispatched == []
+    task = server.scheduler.tasks[0]
+
+    # 每个调度周期（2 tick）只派发一条命令
+    server.scheduler.tick(2)
+    assert server.dispatched == ["setblock 0 64 0 stone"]
+    server.scheduler.tick(4)
+    assert server.dispatched == ["setblock 0 64 0 stone", "setblock 1 64 0 stone", "setblock 2 64 0 stone"]
+
+    assert progress == [("steve", 1, 3), ("steve", 2, 3), ("steve", 3, 3)]
+    assert completed == [("steve", 3, 3)]
+    assert task.cancelled
+    assert not executor.is_executing()
+
+
+def test_stop_execution_cancels_remaining_commands(server, make_settings):
+    cancelled = []
+    completed = []
+    executor, _ = _start(server, make_settings(), ["setblock ~ ~ ~ stone"] * 5,
+                         on_cancel=lambda *args: cancelled.append(args),
+                         on_complete=lambda *args: completed.append(args))
+    server.scheduler.tick()
+
+    executor.stop_execution()
+    server.scheduler.tick(10)
+
+    assert len(server.dispatched) == 1
+    assert cancelled == [("steve", 1, 5)]
+    assert completed == []
+    assert not server.scheduler.tasks
@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+pytest.importorskip("endstone")
+
+from endstone_arc_ai_builder import OpenAIManager as openai_module
+from endstone_arc_ai_builder.OpenAIManager import OpenAIManager
+
+URL = "https://api.example.com/v1/chat/completions"
+CONTENT = ('好的，方案如下：\n'
+           '{"commands": ["fill ~-1 ~ ~-1 ~1 ~ ~1 stone", "say hi", "setblock ~ ~1 ~ glass"], '
+           '"estimated_cost": 1234, "description": "{不是JSON}"}\n'
+           '以上 }')
+
+
+@pytest.fixture
+def manager():
+    manager = OpenAIManager("test-key", "https://api.example.com/v1")
+    yield manager
+    manager.close()
+
+
+def _sse_response(content: str, chunk_size: int = 7) -> httpx.Response:
+    lines = [": keep-alive", "event: message"]
+    for i in range(0, len(content), chunk_size):
+        event = {"choices": [{"index": 0, "delta": {"content": content[i:i + chunk_size]}}]}
+        lines.append("data: " + json.dumps(event, ensure_ascii=False))
+    # [DONE] 之后的数据不再解析
+    lines += ["data: [DONE]", "data: not json"]
+    body = ("\n\n".join(lines) + "\n\n").encode("utf-8")
+
+    async def stream():
+        # 按小块返回，数据行会跨越多个数据块
+        for i in range(0, len(body), 5):
+            yield body[i:i + 5]
+
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream())
+
+
+def _json_response(content: str) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]})
+
+
+def _read(manager, response: httpx.Response):
+    async def read():
+        transport = httpx.MockTransport(lambda request: response)
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("POST", URL) as streamed:
+                return await manager._read_response(streamed)
+    return asyncio.run(read())
+
+
+def _call(manager, monkeypatch, responses):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        result = responses[len(requests) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def no_sleep(_):
+        pass
+
+    monkeypatch.setattr(openai_module.asyncio, "sleep", no_sleep)
+    manager.async_session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return asyncio.run(manager._call_openai_api("prompt")), requests
+
+
+def test_parse_response(manager):
+    # 只保留 fill 与 setblock 指令
+    commands, cost = manager._parse_response(CONTENT)
+    assert commands == ["fill ~-1 ~ ~-1 ~1 ~ ~1 stone", "setblock ~ ~1 ~ glass"]
+    assert cost == 1234
+
+
+def test_parse_response_without_json(manager):
+    assert manager._parse_response("抱歉，无法生成") == ([], 0)
+    assert manager._parse_response("[1, 2]") == ([], 0)
+
+
+def test_call_openai_api_retries_server_errors(manager, monkeypatch):
+    responses = [httpx.Response(503), httpx.ConnectError("connection refused"), _json_response(CONTENT)]
+    content, requests = _call(manager, monkeypatch, responses)
+    assert content == CONTENT
+    assert len(requests) == 3
+
+
+def test_call_openai_api_gives_up_after_max_retries(manager, monkeypatch):
+    content, requests = _call(manager, monkeypatch, [httpx.Response(502)] * 3)
+    assert content is None
+    assert len(requests) == 3
+
+
+def test_call_openai_api_does_not_retry_client_errors(manager, monkeypatch):
+    content, requests = _call(manager, monkeypatch, [httpx.Response(401, json={"error": {"message": "bad key"}})])
+    assert content is None
+    assert len(requests) == 1
+
+
+def test_read_response_joins_sse_deltas(manager):
+    assert _read(manager, _sse_response(CONTENT)) == CONTENT
+
+
+def test_read_response_accepts_plain_json(manager):
+    assert _read(manager, _json_response(CONTENT)) == CONTENT
+
+
+def test_read_response_without_choices(manager):
+    assert _read(manager, httpx.Response(200, json={"choices": []})) is None
+    empty_stream = httpx.Response(200, headers={"content-type": "text/event-stream"}, content=b"data: [DONE]\n\n")
+    assert _read(manager, empty_stream) is None
+
+
+def test_read_response_error_status(manager):
+    response = httpx.Response(400, json={"error": {"message": "Invalid max_tokens value"}})
+    assert _read(manager, response) is None
+
+
+def test_call_openai_api_streams_request(manager, monkeypatch):
+    content, requests = _call(manager, monkeypatch, [_sse_response(CONTENT)])
+    assert content == CONTENT
+    body = json.loads(requests[0].content)
+    assert body["stream"] is True
+    assert body["messages"][-1] == {"role": "user", "content": "prompt"}
@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("endstone")
+
+from endstone_arc_ai_builder.SettingManager import SettingManager
+
+
+@pytest.fixture
+def settings_file(tmp_path, monkeypatch):
+    # 配置目录是相对于服务器工作目录的 plugins/ARCAIBuilder
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "plugins").mkdir()
+    return tmp_path / "plugins" / "ARCAIBuilder" / "default_settings.txt"
+
+
+def _entry_lines(path):
+    return [line for line in path.read_text(encoding="utf-8").splitlines() if line and not line.startswith("#")]
+
+
+def test_creates_default_file(settings_file):
+    manager = SettingManager()
+    assert settings_file.exists()
+    assert manager.GetSetting("api_max_concurrency") == "4"
+    assert manager.GetSetting("openai_api_key") is None
+
+
+def test_set_setting_appends_and_later_lines_win(settings_file):
+    manager = SettingManager()
+    manager.SetSetting("ai_model", "gpt-4o")
+    manager.SetSetting("ai_model", "deepseek-chat")
+
+    lines = _entry_lines(settings_file)
+    assert lines[-2:] == ["ai_model=gpt-4o", "ai_model=deepseek-chat"]
+    assert SettingManager().GetSetting("ai_model") == "deepseek-chat"
+
+
+def test_append_after_missing_trailing_newline(settings_file):
+    settings_file.parent.mkdir()
+    settings_file.write_text("ai_model=a", encoding="utf-8")
+
+    SettingManager().SetSetting("build_delay", 0.5)
+
+    assert settings_file.read_text(encoding="utf-8") == "ai_model=a\nbuild_delay=0.5\n"
+    reloaded = SettingManager()
+    assert reloaded.GetSetting("ai_model") == "a"
+    assert reloaded.GetSetting("build_delay") == "0.5"
+
+
+def test_compact_drops_overwritten_lines(settings_file):
+    manager = SettingManager()
+    for i in range(5):
+        manager.SetSetting("ai_model", f"model-{i}")
+    manager.compact()
+
+    lines = _entry_lines(settings_file)
+    assert len(lines) == len(set(line.split("=", 1)[0] for line in lines))
+    assert "ai_model=model-4" in lines
+    assert SettingManager().setting_dict == manager.setting_dict
+
+
+def test_compacts_on_load_when_overrides_pile_up(settings_file):
+    manager = SettingManager()
+    for i in range(200):
+        manager.SetSetting("ai_model", f"model-{i}")
+
+    SettingManager()
+
+    lines = _entry_lines(settings_file)
+    assert [line for line in lines if line.startswith("ai_model=")] == ["ai_model=model-199"]
+
+
+def test_small_file_is_not_rewritten_on_load(settings_file):
+    manager = SettingManager()
+    manager.SetSetting("ai_model", "gpt-4o")
+
+    SettingManager()
+
+    # 未触发重写时保留默认配置文件中的注释
+    assert settings_file.read_text(encoding="utf-8").startswith("# ARC AI Builder")